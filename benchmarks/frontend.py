@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+"""Measure the frontend with a mix of relevant and irrelevant hook traffic.
+
+Sends a mix of push, merge request, tag push, pipeline and job events through
+the WSGI frontend and reports the mean time per request for each event.
+
+Run from the top level directory: python -m benchmarks.frontend
+"""
+
+from collections import defaultdict
+from queue import Queue
+from werkzeug.test import EnvironBuilder
+import json
+import logging
+import time
+
+from snolla.frontend import Frontend
+
+REQUESTS = 20000
+
+# Each cycle sends the events below, roughly in the proportion seen on a busy
+# GitLab instance with all hooks enabled. Only push events are handled, all
+# other events are ignored before their body is read.
+MIX = (
+    ('Push Hook', 'push', 2),
+    ('Merge Request Hook', 'merge_request', 2),
+    ('Tag Push Hook', 'push', 1),
+    ('Pipeline Hook', 'pipeline', 5),
+    ('Job Hook', 'pipeline', 10),
+)
+
+
+def payloads():
+    """Build the request bodies."""
+    with open('tests/test_data/gitlab_push_fixture_1.json', 'rt') as f:
+        push = json.load(f)
+    push['commits'] = push['commits'] * 10
+    with open('tests/test_data/gitlab_merge_request_fixture_1.json', 'rt') as f:
+        merge_request = json.load(f)
+    pipeline = {'object_kind': 'pipeline', 'builds': [{'id': i, 'stage': 'test', 'name': 'job {}'.format(i),
+        'status': 'success', 'runner': {'description': 'shared runner'}} for i in range(200)]}
+    return {name: json.dumps(data).encode('utf-8') for name, data in
+            (('push', push), ('merge_request', merge_request), ('pipeline', pipeline))}
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    queue = Queue()
+    app = Frontend({'general': {'max_content_length': 1048576},
+        'instrumentation': {'tracing': False, 'profiler': False, 'queue_stats': False}}, queue)
+    bodies = payloads()
+
+    cycle = [(event, bodies[body]) for event, body, weight in MIX for _ in range(weight)]
+    durations = defaultdict(float)
+    counts = defaultdict(int)
+    start_response = lambda status, headers: None
+
+    start = time.perf_counter()
+    for i in range(REQUESTS):
+        event, body = cycle[i % len(cycle)]
+        environ = EnvironBuilder('/gitlab', method='POST', data=body, content_type='application/json',
+                headers={'X-Gitlab-Event': event}).get_environ()
+        t = time.perf_counter()
+        b''.join(app(environ, start_response))
+        durations[event] += time.perf_counter() - t
+        counts[event] += 1
+    total = time.perf_counter() - start
+
+    print('{} requests, {} commits queued'.format(REQUESTS, sum(len(commits) for commits in queue.queue)))
+    for event, _, _ in MIX:
+        print('{:20} {:6} requests {:8.1f} us/request'.format(event, counts[event], durations[event] / counts[event] * 1e6))
+    print('{:.0f} requests/s (including request setup)'.format(REQUESTS / total))
+
+if __name__ == '__main__':
+    main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
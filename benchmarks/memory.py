@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+"""Measure the memory held by queued Bugzilla tasks.
+
+Fills a bugzilla_task_queue with 100k tasks (25k commits that reference four
+bugs each, pushed in batches of 20 commits) and reports the memory allocated
+for the queued tasks, once with the plain dicts snolla used to queue on a
+plain queue and once with the updates snolla queues now, on the coalescing
+queue of a tenant.
+
+Run from the top level directory: python -m benchmarks.memory
+"""
+
+from queue import Queue
+import tracemalloc
+
+from snolla import load_config
+from snolla.tenant import DEFAULT_TENANT, Tenant
+import snolla.utils as utils
+
+TASKS = 100000
+BUGS_PER_COMMIT = 4
+COMMITS_PER_PUSH = 20
+
+
+def gitlab_pushes():
+    """Generate parsed gitlab push messages."""
+    commits = TASKS // BUGS_PER_COMMIT
+    for push in range(commits // COMMITS_PER_PUSH):
+        yield {
+            'ref': 'refs/heads/master',
+            'project': {'path_with_namespace': 'playground/qt5demo'},
+            'commits': [{
+                'id': '{:040x}'.format(push * COMMITS_PER_PUSH + i),
+                'message': 'Fix the frobnicator (see #{} #{} #{} #{}).'.format(*range(i, i + BUGS_PER_COMMIT)),
+                'timestamp': '2014-03-05T08:40:01+01:00',
+                'url': 'https://git/playground/qt5demo/commit/{:040x}'.format(push * COMMITS_PER_PUSH + i),
+                # Each push message is parsed on its own, so author strings
+                # are distinct objects per push.
+                'author': {'name': ''.join(('Foo', ' Bar')), 'email': ''.join(('foo', '@bar.org'))},
+                } for i in range(COMMITS_PER_PUSH)],
+            }
+
+
+def legacy_commits(push):
+    """The per-commit dicts as extracted before."""
+    return [{
+        'id': commit['id'],
+        'origin': push['ref'][len('refs/heads/'):],
+        'message': commit['message'],
+        'timestamp': commit['timestamp'],
+        'url': commit['url'],
+        'author_name': commit['author']['name'],
+        'author_email': commit['author']['email'],
+        } for commit in push['commits']]
+
+
+def legacy_task(task, bugid, commit):
+    """The per-task dicts as queued before."""
+    return {'bugid': bugid, 'commit': commit, 'task': task}
+
+
+def measure(fill, queue):
+    """Fill a queue and return the traced memory in bytes."""
+    tracemalloc.start()
+    fill(queue)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size
+
+
+def fill_legacy(queue):
+    """Queue a dict per task, as snolla did before."""
+    for push in gitlab_pushes():
+        for commit in legacy_commits(push):
+            for bugid in range(BUGS_PER_COMMIT):
+                queue.put(legacy_task('comment', bugid, commit))
+    assert queue.qsize() == TASKS
+
+
+def fill_updates(queue, order):
+    """Queue an update per bug and push, as the Snolla worker does."""
+    for push in gitlab_pushes():
+        tasks = [utils.create_bugzilla_task('comment', bugid, commit)
+                for commit in utils.extract_gitlab_commit_data(push) for bugid in range(BUGS_PER_COMMIT)]
+        for update in utils.create_bugzilla_updates(tasks, order):
+            queue.put(update)
+    assert sum(len(update['tasks']) for update in queue.pending.values()) == TASKS
+
+
+def main():
+    valid, config = load_config('config/snolla.conf.example', 'config/snolla.conf.spec')
+    assert valid
+    tenant = Tenant(DEFAULT_TENANT, config, ('',))
+    order = utils.get_task_order_from_config(config)
+
+    legacy = measure(fill_legacy, Queue())
+    records = measure(lambda queue: fill_updates(queue, order), tenant.bugzilla_task_queue)
+    print('{} queued tasks in {} updates'.format(TASKS, tenant.bugzilla_task_queue.qsize()))
+    print('dicts:   {:8.1f} MiB'.format(legacy / 2**20))
+    print('records: {:8.1f} MiB ({:.0%})'.format(records / 2**20, records / legacy))
+
+if __name__ == '__main__':
+    main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
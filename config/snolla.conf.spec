@@ -5,13 +5,57 @@
 allowed_origins = string_list(min=1, default=list('master'))
 extract_regex = string(default='(?P<action>\w+)?:?\s*#(?P<bugid>\d+)')
 loglevel = option('CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', default='INFO')
+max_content_length = integer(min=1, default=1048576)
+
+# Validate entries of the instrumentation section
+[instrumentation]
+tracing = boolean(default=False)
+profiler = boolean(default=False)
+profiler_interval = integer(min=1, default=10)
+profiler_max_seconds = integer(min=1, default=60)
+queue_stats = boolean(default=False)
+capture_path = string(default='')
+
+# Validate entries of the scheduling section
+[scheduling]
+interactive_origins = string_list(default=list('master'))
+bulk_push_size = integer(min=1, default=20)
+interactive_weight = integer(min=1, default=8)
+bulk_weight = integer(min=1, default=1)
+retry_weight = integer(min=1, default=1)
 
 # Validate entries of the tasks section
+# The order of a task defines the order in which the changes of the tasks of a
+# push are combined into a single update per bug.
 [tasks]
 [[comment]]
 enabled = boolean(default=True)
 keywords = string_list(min=1, default=list('comment', 'comments', 'mention', 'mentions', 'see', 'seealso'))
 template = string(default='')
+order = integer(default=10)
+[[status]]
+enabled = boolean(default=False)
+keywords = string_list(min=1, default=list('fix', 'fixes', 'fixed', 'close', 'closes', 'closed'))
+status = string(min=1, default='RESOLVED')
+resolution = string(default='FIXED')
+template = string(default='')
+order = integer(default=20)
+[[see_also]]
+enabled = boolean(default=False)
+keywords = string_list(min=1, default=list('ref', 'refs', 'references'))
+template = string(default='{url}')
+order = integer(default=30)
+[[keywords]]
+enabled = boolean(default=False)
+keywords = string_list(min=1, default=list('backport', 'backports'))
+add = string_list(default=list())
+remove = string_list(default=list())
+order = integer(default=40)
+[[whiteboard]]
+enabled = boolean(default=False)
+keywords = string_list(min=1, default=list('whiteboard',))
+template = string(default='')
+order = integer(default=50)
 
 # Validate entries of the bugzilla section
 [bugzilla]
@@ -20,3 +64,42 @@ username = string(min=1)
 password = string(min=1)
 bugzilla_path = string(default='bugzilla')
 bugzilla_additional_args = string_list(default=list())
+workers = integer(min=1, default=1)
+retries = integer(min=0, default=0)
+retry_delay = integer(min=0, default=10)
+
+# Validate entries of the gitlab section
+[gitlab]
+enabled = boolean(default=False)
+url = string(default='')
+private_token = string(default='')
+per_page = integer(min=1, max=100, default=100)
+workers = integer(min=1, default=4)
+cache_size = integer(min=0, default=256)
+timeout = integer(min=1, default=30)
+
+# Validate entries of the tenants section
+[tenants]
+[[__many__]]
+projects = string_list(min=1)
+allowed_origins = string_list(min=1, default=None)
+extract_regex = string(default=None)
+[[[tasks]]]
+[[[[__many__]]]]
+enabled = boolean(default=True)
+keywords = string_list(min=1, default=None)
+template = string(default=None)
+order = integer(default=None)
+status = string(min=1, default=None)
+resolution = string(default=None)
+add = string_list(default=None)
+remove = string_list(default=None)
+[[[bugzilla]]]
+url = string(min=1, default=None)
+username = string(min=1, default=None)
+password = string(min=1, default=None)
+bugzilla_path = string(default=None)
+bugzilla_additional_args = string_list(default=None)
+workers = integer(min=1, default=None)
+retries = integer(min=0, default=None)
+retry_delay = integer(min=0, default=None)
@@ -7,9 +7,10 @@ from validate import Validator
 import logging
 import sys
 
+from snolla.capture import CaptureMiddleware
 from snolla.frontend import Frontend
-from snolla.snolla import SnollaWorker
-from snolla.bugzilla import BugzillaWorker
+from snolla.gitlab import GitlabWorker
+from snolla.tenant import TenantRouter, create_tenants
 
 
 def load_config(configfile, configspec):
@@ -49,21 +50,40 @@ def create_app():
     # Setup logging
     logging.basicConfig(level=getattr(logging, config['general']['loglevel']))
 
-    # Create the queues
-    commit_queue = Queue()
-    bugzilla_task_queue = Queue()
+    app = create_frontend(config)
 
-    # Start a Snolla worker thread
-    tw = SnollaWorker(config, commit_queue, bugzilla_task_queue)
-    tw.setDaemon(True)
-    tw.start()
+    # Record all requests, if enabled
+    if config['instrumentation']['capture_path']:
+        app = CaptureMiddleware(app, config['instrumentation']['capture_path'],
+                config['general']['max_content_length'])
+    return app
 
-    # Start a Bugzilla task handler thread
-    tw = BugzillaWorker(config, bugzilla_task_queue)
-    tw.setDaemon(True)
-    tw.start()
+
+def create_frontend(config, bugzilla_worker=None):
+    """Start all worker threads and setup the wsgi frontend.
+
+    Args:
+        config - The parsed configuration.
+        bugzilla_worker - The class of the Bugzilla workers, BugzillaWorker
+                          if None.
+    Returns:
+        The Frontend."""
+    # Create the tenants and start their Snolla and Bugzilla worker threads
+    tenants = create_tenants(config)
+    for tenant in tenants:
+        tenant.start(bugzilla_worker)
+
+    router = TenantRouter(tenants)
+
+    # Start a GitLab worker thread to fetch the commits of truncated pushes
+    gitlab_queue = None
+    if config['gitlab']['enabled']:
+        gitlab_queue = Queue()
+        tw = GitlabWorker(config, gitlab_queue, router)
+        tw.daemon = True
+        tw.start()
 
     # Setup the WSGI frontend
-    return Frontend(commit_queue)
+    return Frontend(config, router, gitlab_queue)
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
@@ -2,9 +2,13 @@
 # This file is part of snolla. See README for more information.
 
 from threading import Thread
+import json
 import subprocess
 import logging
 
+from snolla.instrumentation import get_trace
+import snolla.utils as utils
+
 class BugzillaWorker(Thread):
     """The Bugzilla worker."""
 
@@ -46,33 +50,116 @@ class BugzillaWorker(Thread):
     def run(self):
         """Thread main loop."""
         while True:
-            task = self.queue.get()
-            self.log.debug('Start processing task "{task}".'.format(**task))
+            update = self.queue.get()
+            get_trace(update['tasks'][0]['commit']).emit('task queue wait', self.queue.wait())
+            self.log.debug('Start processing update of bug {bugid}.'.format(**update))
 
-            self.process(task)
+            self.process(update)
 
-            self.log.info('Finished processing task "{task}".'.format(**task))
+            self.log.info('Finished processing update of bug {bugid}.'.format(**update))
             self.queue.task_done()
 
-    def process(self, task):
-        """Process a bugzilla task."""
-        try:
-            getattr(self, 'on_{task}'.format(**task))(task)
-        except AttributeError as e:
-            self.log.error(e)
-            self.log.error('Unknown bugzilla task found: "{task}".'.format(**task))
+    def process(self, update):
+        """Process a Bugzilla update.
 
-    def on_comment(self, task):
-        """Handle comment tasks."""
-        args = self.bugzilla_default_args[:]
-        args.extend((
-            "modify",
-            "{bugid}".format(**task),
-            "--comment={}".format(self.config['tasks']['comment']['template']).format(**task['commit']))
-            )
-        if self.external_command(args) == True:
-            self.log.info('Added a new comment to bug {bugid}.'.format(**task))
+        The changes of all tasks of the update are sent to Bugzilla in a single
+        call."""
+        trace = get_trace(update['tasks'][0]['commit'])
+        with trace.span('render'):
+            args = self.render(update)
+        if args is None:
+            self.log.warning('No changes for bug {bugid}.'.format(**update))
+            return
+
+        with trace.span('backend'):
+            success = self.external_command(args)
+        tasks = ', '.join(task['task'] for task in update['tasks'])
+        if success == True:
+            self.log.info('Updated bug {bugid} ({}).'.format(tasks, **update))
         else:
-            self.log.error('Could not add a new comment to bug {bugid}.'.format(**task))
+            self.log.error('Could not update bug {bugid} ({}).'.format(tasks, **update))
+            self.retry(update)
+
+    def render(self, update):
+        """Render the arguments to update a bug with python-bugzilla's bugzilla.
+
+        Each task of the update adds its changes with its on_<task> handler, in
+        the order of the tasks. The comments of all tasks are joined, for the
+        status and the resolution the last task wins.
+
+        Returns:
+            The list of arguments or None if the tasks have no changes.
+        """
+        changes = {'comment': [], 'status': None, 'resolution': None, 'see_also': [], 'keywords': [], 'whiteboard': []}
+        for task in update['tasks']:
+            try:
+                handler = getattr(self, 'on_{task}'.format(**task))
+            except AttributeError:
+                self.log.error('Unknown bugzilla task found: "{task}".'.format(**task))
+                continue
+            handler(task, changes)
+        if not any(changes.values()):
+            return None
+
+        args = self.bugzilla_default_args[:]
+        args.extend(("modify", "{bugid}".format(**update)))
+        if changes['comment']:
+            args.append("--comment={}".format('\n\n'.join(changes['comment'])))
+        if changes['status']:
+            args.append("--status={}".format(changes['status']))
+        if changes['resolution']:
+            args.append("--field=resolution={}".format(changes['resolution']))
+        args.extend("--keywords={}".format(keyword) for keyword in dict.fromkeys(changes['keywords']))
+        args.extend("--whiteboard={}".format(text) for text in dict.fromkeys(changes['whiteboard']))
+        if changes['see_also']:
+            args.append("--field-json={}".format(json.dumps({'see_also': {'add': list(dict.fromkeys(changes['see_also']))}})))
+        return args
+
+    def on_comment(self, task, changes):
+        """Handle comment tasks: add a comment."""
+        changes['comment'].append(utils.format_commit(self.config['tasks']['comment']['template'], task['commit']))
+
+    def on_status(self, task, changes):
+        """Handle status tasks: change the status and the resolution, with an
+        optional comment."""
+        config = self.config['tasks']['status']
+        changes['status'] = config['status']
+        changes['resolution'] = config['resolution']
+        if config['template']:
+            changes['comment'].append(utils.format_commit(config['template'], task['commit']))
+
+    def on_see_also(self, task, changes):
+        """Handle see also tasks: add a see also url, unless it is empty."""
+        url = utils.format_commit(self.config['tasks']['see_also']['template'], task['commit'])
+        if url:
+            changes['see_also'].append(url)
+
+    def on_keywords(self, task, changes):
+        """Handle keywords tasks: add and remove keywords."""
+        config = self.config['tasks']['keywords']
+        changes['keywords'].extend('+{}'.format(keyword) for keyword in config['add'])
+        changes['keywords'].extend('-{}'.format(keyword) for keyword in config['remove'])
+
+    def on_whiteboard(self, task, changes):
+        """Handle whiteboard tasks: append to the whiteboard, unless the text is
+        empty."""
+        text = utils.format_commit(self.config['tasks']['whiteboard']['template'], task['commit'])
+        if text:
+            changes['whiteboard'].append('+{}'.format(text))
+
+    def retry(self, update):
+        """Queue a failed update again, unless it has been retried too often.
+
+        Retried updates are scheduled in their own class and back off before
+        they are dequeued again, see utils.get_update_class and
+        utils.get_update_delay.
+
+        Return True if the update was queued again, False otherwise."""
+        retries = self.config['bugzilla']['retries']
+        if not retries or update['attempt'] >= retries:
+            return False
+        self.queue.put(update.replace(attempt=update['attempt'] + 1))
+        self.log.info('Retrying update of bug {bugid}.'.format(**update))
+        return True
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
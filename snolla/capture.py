@@ -0,0 +1,232 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from io import BufferedReader, BytesIO, RawIOBase
+from threading import Lock
+import gzip
+import json
+import logging
+import struct
+import time
+import zlib
+
+from snolla.records import Delivery
+
+# Each delivery in a capture file is stored as a frame: a header with the
+# arrival time and the lengths of the metadata and the body, followed by the
+# metadata as json and the raw body.
+FRAME_HEADER = struct.Struct('<dII')
+
+# Headers that are not recorded, as they carry secrets.
+SECRET_HEADERS = frozenset(('X-Gitlab-Token', 'Authorization', 'Cookie'))
+
+# The magic bytes at the start of each gzip member.
+GZIP_MAGIC = b'\x1f\x8b'
+
+# The number of bytes read from a capture file at once.
+READ_SIZE = 64 * 1024
+
+
+def create_frame(delivery):
+    """Create the frame of a delivery."""
+    metadata = json.dumps({
+        'method': delivery['method'],
+        'path': delivery['path'],
+        'query_string': delivery['query_string'],
+        'headers': delivery['headers'],
+        }, separators=(',', ':')).encode('utf-8')
+    return FRAME_HEADER.pack(delivery['timestamp'], len(metadata), len(delivery['body'])) + metadata + delivery['body']
+
+
+class CaptureWriter():
+    """Append deliveries to a compressed capture file.
+
+    Each frame is written as a complete gzip member of its own, so a crash
+    can only cut off the frame being written. Such a frame is skipped when the
+    capture is read, and frames appended after a restart are still read."""
+
+    def __init__(self, path):
+        """Open the capture file for appending."""
+        self.file = open(path, 'ab')
+        self.lock = Lock()
+
+    def write(self, delivery):
+        """Append a delivery."""
+        member = gzip.compress(create_frame(delivery))
+        with self.lock:
+            self.file.write(member)
+            self.file.flush()
+
+    def close(self):
+        """Close the capture file."""
+        with self.lock:
+            self.file.close()
+
+
+def read_members(f):
+    """Read the gzip members of a file.
+
+    A damaged member, eg. one that was cut off by a crash, is skipped: reading
+    continues at the next gzip header after its start.
+
+    Yields:
+        The decompressed data of each complete member.
+    """
+    data = b''
+    eof = False
+    while True:
+        start = data.find(GZIP_MAGIC)
+        if start < 0:
+            if eof:
+                return
+            # Keep a byte that may start the magic of the next read.
+            data = data[-1:] + f.read(READ_SIZE)
+            eof = len(data) <= 1
+            continue
+
+        member = data[start:]
+        data = b''
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        decompressed = []
+        try:
+            decompressed.append(decompressor.decompress(member))
+            while not decompressor.eof:
+                chunk = f.read(READ_SIZE)
+                if not chunk:
+                    eof = True
+                    break
+                member += chunk
+                decompressed.append(decompressor.decompress(chunk))
+        except zlib.error:
+            pass
+
+        if decompressor.eof:
+            yield b''.join(decompressed)
+            data = decompressor.unused_data
+        else:
+            data = member[1:]
+
+
+def read_capture(path):
+    """Read the deliveries of a capture file.
+
+    Damaged frames, eg. a frame that was cut off by a crash, are skipped.
+
+    Yields:
+        Delivery records in the order they were captured.
+    """
+    with open(path, 'rb') as f:
+        for member in read_members(f):
+            offset = 0
+            while offset + FRAME_HEADER.size <= len(member):
+                timestamp, metadata_length, body_length = FRAME_HEADER.unpack_from(member, offset)
+                offset += FRAME_HEADER.size
+                metadata = member[offset:offset + metadata_length]
+                offset += metadata_length
+                body = member[offset:offset + body_length]
+                offset += body_length
+                if len(metadata) < metadata_length or len(body) < body_length:
+                    break
+
+                metadata = json.loads(metadata.decode('utf-8'))
+                yield Delivery(
+                        timestamp=timestamp,
+                        method=metadata['method'],
+                        path=metadata['path'],
+                        query_string=metadata['query_string'],
+                        headers=tuple(tuple(header) for header in metadata['headers']),
+                        body=body,
+                    )
+
+
+class CapturedInput(RawIOBase):
+    """The input of a captured request: the captured start of the body,
+    followed by the rest of the original input."""
+
+    def __init__(self, body, stream):
+        """Setup the input with the captured body and the original input."""
+        self.body = BytesIO(body)
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.body.read(len(buffer)) or self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class CaptureMiddleware():
+    """A WSGI middleware that records all requests to a capture file.
+
+    Headers that carry secrets, see SECRET_HEADERS, are not recorded."""
+
+    def __init__(self, app, path, max_content_length):
+        """Setup the middleware.
+
+        Args:
+            app - The WSGI app.
+            path - The path of the capture file.
+            max_content_length - The maximum number of bytes of a body to
+                                 capture, larger bodies are truncated.
+        """
+        self.app = app
+        self.writer = CaptureWriter(path)
+        self.max_content_length = max_content_length
+        self.log = logging.getLogger(__class__.__name__)
+
+    def read_body(self, environ):
+        """Read the body of a request, up to one byte more than the maximum,
+        and replace the input of the request so the app still gets the whole
+        body.
+
+        A body without a content length, eg. with chunked transfer encoding,
+        is read until the end of the input if the server terminates the input,
+        like werkzeug and gunicorn do. Otherwise the body is not read, as the
+        app does not read it either.
+
+        Returns:
+            The captured body.
+        """
+        limit = self.max_content_length + 1
+        try:
+            length = int(environ['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            length = None if environ.get('wsgi.input_terminated') else 0
+        if length == 0:
+            return b''
+
+        stream = environ['wsgi.input']
+        body = stream.read(limit if length is None else min(length, limit))
+        if len(body) < limit:
+            environ['wsgi.input'] = BytesIO(body)
+        else:
+            environ['wsgi.input'] = BufferedReader(CapturedInput(body, stream))
+        return body
+
+    def __call__(self, environ, start_response):
+        """Capture the request and pass it on to the app."""
+        timestamp = time.time()
+        body = self.read_body(environ)
+
+        headers = [(key[5:].replace('_', '-').title(), value) for key, value in environ.items() if key.startswith('HTTP_')]
+        headers = [(key, value) for key, value in headers if key not in SECRET_HEADERS]
+        if 'CONTENT_TYPE' in environ:
+            headers.append(('Content-Type', environ['CONTENT_TYPE']))
+
+        try:
+            self.writer.write(Delivery(
+                    timestamp=timestamp,
+                    method=environ['REQUEST_METHOD'],
+                    path=environ.get('PATH_INFO', '/'),
+                    query_string=environ.get('QUERY_STRING', ''),
+                    headers=tuple(headers),
+                    body=body,
+                ))
+        except OSError as e:
+            self.log.exception(e)
+
+        return self.app(environ, start_response)
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
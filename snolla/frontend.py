@@ -1,54 +1,164 @@
 #!/usr/bin/python
 # This file is part of snolla. See README for more information.
 
-from json import loads
-from werkzeug.exceptions import HTTPException, BadRequest, NotFound, MethodNotAllowed
+from json import dumps, loads
+from werkzeug.exceptions import HTTPException, BadRequest, Conflict, NotFound, MethodNotAllowed, RequestEntityTooLarge
 from werkzeug.routing import Map, Rule
 from werkzeug.wrappers import Request, Response
 import logging
 
+from snolla.instrumentation import NULL_TRACE, SamplingProfiler, Trace, format_collapsed_stacks
 import snolla.utils as utils
 
 class Frontend():
     """The Snolla wsgi frontend."""
 
-    def __init__(self, queue):
-        """Setup the Snolla frontend."""
+    # The supported values of the X-Gitlab-Event header and their handlers.
+    # Merge request events are not supported: GitLab sends the new commits of
+    # a merge with the push event of the target branch, which links them once.
+    gitlab_events = {
+        'Push Hook': 'gitlab_push',
+    }
+
+    def __init__(self, config, queue, gitlab_queue=None):
+        """Setup the Snolla frontend.
+
+        Truncated pushes are put on the gitlab_queue, if given, to fetch their
+        missing commits."""
+        self.config = config
         self.queue = queue
+        self.gitlab_queue = gitlab_queue
+        self.max_content_length = config['general']['max_content_length']
+        self.tracing = config['instrumentation']['tracing']
+        self.profiler = None
         self.log = logging.getLogger(__class__.__name__)
 
         # URL map
         self.url_map = Map([
             Rule('/', endpoint='index'),
-            Rule('/gitlab/push', endpoint='gitlab_push'),
+            Rule('/gitlab', endpoint='gitlab'),
+            Rule('/gitlab/push', endpoint='gitlab', defaults={'event': 'Push Hook'}),
         ])
 
+        # The profiler endpoint is only available if enabled
+        if config['instrumentation']['profiler']:
+            self.profiler = SamplingProfiler(config['instrumentation']['profiler_interval'] / 1000)
+            self.profiler_max_seconds = config['instrumentation']['profiler_max_seconds']
+            self.url_map.add(Rule('/admin/profile', endpoint='profile'))
+
+        # The queue statistics endpoint is only available if enabled
+        if config['instrumentation']['queue_stats']:
+            self.url_map.add(Rule('/admin/queues', endpoint='queues'))
+
     def on_index(self, request):
         """The index page."""
         self.log.debug('Received request: "{}".'.format(request))
         return Response('Welcome to Snolla.')
 
-    def on_gitlab_push(self, request):
-        """The endpoint for gitlab post commit hooks."""
-        self.log.debug('Received request: "{}".'.format(request))
-        if request.method == 'POST':
-            if request.headers.get('content-type') == 'application/json':
-                raw_data = request.stream.read().decode('utf-8')
-                self.log.debug('Got POST data: "{}".'.format(raw_data))
-
-                extracted_commits = utils.extract_gitlab_commit_data(loads(raw_data))
-                for commit in extracted_commits:
-                    self.queue.put(commit)
-
-                msg = 'Successfully extracted {} commits.'.format(len(extracted_commits))
-                self.log.info(msg)
-                return Response(msg)
-            else:
-                msg = 'No POST data as application/json supplied.'
+    def on_gitlab(self, request, event=None):
+        """The endpoint for gitlab web hooks.
+
+        Requests are routed on their X-Gitlab-Event header (or the given
+        default event if the header is missing) and their size before the body
+        is read. Unsupported events are ignored without touching the body."""
+        # Arguments are formatted lazily, as repr(request) is expensive.
+        self.log.debug('Received request: "%s".', request)
+        if request.method != 'POST':
+            return MethodNotAllowed()
+
+        event = request.headers.get('X-Gitlab-Event', event)
+        handler = self.gitlab_events.get(event)
+        if handler is None:
+            msg = 'Ignoring unsupported GitLab event "{}".'.format(event)
+            self.log.debug(msg)
+            return Response(msg, status=202)
+
+        if request.headers.get('content-type') != 'application/json':
+            msg = 'No POST data as application/json supplied.'
+            self.log.warning(msg)
+            return BadRequest(msg)
+
+        if request.content_length is not None and request.content_length > self.max_content_length:
+            self.log.warning('Request with {} bytes exceeds the maximum content length.'.format(request.content_length))
+            return RequestEntityTooLarge()
+
+        raw_data = request.stream.read(self.max_content_length + 1)
+        if len(raw_data) > self.max_content_length:
+            self.log.warning('Request exceeds the maximum content length.')
+            return RequestEntityTooLarge()
+
+        trace = Trace(request.headers.get('X-Gitlab-Event-UUID')) if self.tracing else NULL_TRACE
+        with trace.span('parse'):
+            try:
+                raw_data = raw_data.decode('utf-8')
+                self.log.debug('Got POST data: "%s".', raw_data)
+                data = loads(raw_data)
+            except ValueError as e:
+                msg = 'Invalid json supplied: {}.'.format(e)
                 self.log.warning(msg)
                 return BadRequest(msg)
-        else:
-            return MethodNotAllowed()
+            if not isinstance(data, dict):
+                msg = 'Invalid json supplied: expected an object.'
+                self.log.warning(msg)
+                return BadRequest(msg)
+
+        with trace.span('extract'):
+            try:
+                extracted_commits = getattr(self, 'handle_' + handler)(data, trace)
+            except (KeyError, TypeError) as e:
+                msg = 'Invalid GitLab {} supplied: {!r}.'.format(event, e)
+                self.log.warning(msg)
+                return BadRequest(msg)
+
+        # The commits of a delivery are queued together, so all tasks for the
+        # same bug are merged into a single update.
+        if extracted_commits:
+            with trace.span('enqueue'):
+                self.queue.put(tuple(extracted_commits))
+
+        msg = 'Successfully extracted {} commits.'.format(len(extracted_commits))
+        self.log.info(msg)
+        return Response(msg)
+
+    def handle_gitlab_push(self, data, trace):
+        """Extract the commits from a gitlab push event."""
+        commits = utils.extract_gitlab_commit_data(data, trace)
+        if self.gitlab_queue is not None:
+            push = utils.extract_gitlab_truncated_push(data, trace)
+            if push is not None and self.check_truncated_push(push):
+                self.log.info('Push with {} commits is truncated, fetching missing commits.'.format(push['push_size']))
+                self.gitlab_queue.put(push)
+        return commits
+
+    def check_truncated_push(self, push):
+        """Check if the missing commits of a truncated push are needed, ie. if a
+        tenant serves its project and allows its origin.
+
+        Return True on success, False on failure."""
+        tenant = self.queue.route(push['project'])
+        if tenant is None:
+            self.log.info('No tenant serves project {project}, not fetching missing commits.'.format(**push))
+            return False
+        if not utils.is_origin_allowed(push['origin'], tenant.config['general']['allowed_origins']):
+            self.log.info('Origin {origin} is not allowed, not fetching missing commits.'.format(**push))
+            return False
+        return True
+
+    def on_profile(self, request):
+        """Profile all threads and return the samples as collapsed stacks.
+
+        The optional query argument 'seconds' sets the duration of the
+        profile."""
+        seconds = min(max(request.args.get('seconds', 10, type=int), 1), self.profiler_max_seconds)
+        self.log.info('Profiling for {} seconds.'.format(seconds))
+        stacks = self.profiler.profile(seconds)
+        if stacks is None:
+            return Conflict('Another profile is running.')
+        return Response(format_collapsed_stacks(stacks), mimetype='text/plain')
+
+    def on_queues(self, request):
+        """Return the waiting items and latencies per scheduling class as json."""
+        return Response(dumps(self.queue.stats(), indent=2, sort_keys=True), mimetype='application/json')
 
     def dispatch_request(self, request):
         """Dispatch a request to one of the on_* members."""
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from threading import Lock, Thread
+import logging
+import math
+import requests
+
+from snolla.instrumentation import get_trace
+import snolla.utils as utils
+
+# The commit id GitLab sends as 'before' for new branches.
+NULL_COMMIT_ID = '0' * 40
+
+
+class GitlabClient():
+    """A client for the GitLab API.
+
+    The client keeps alive a pool of connections, fetches pages concurrently
+    and caches responses."""
+
+    def __init__(self, config):
+        """Setup the client from the [gitlab] section of the configuration."""
+        self.config = config
+        self.api_url = '{}/api/v4'.format(config['gitlab']['url'].rstrip('/'))
+        self.timeout = config['gitlab']['timeout']
+        self.per_page = config['gitlab']['per_page']
+        self.cache_size = config['gitlab']['cache_size']
+        self.cache = OrderedDict()
+        self.cache_lock = Lock()
+        self.log = logging.getLogger(__class__.__name__)
+
+        workers = config['gitlab']['workers']
+        self.session = requests.Session()
+        self.session.headers['PRIVATE-TOKEN'] = config['gitlab']['private_token']
+        self.session.mount(self.api_url, HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def close(self):
+        """Close the connections and stop the page fetching threads."""
+        self.executor.shutdown()
+        self.session.close()
+
+    def get(self, path, params):
+        """Get a json resource from the API.
+
+        Responses are cached, the least recently used response is evicted
+        first.
+
+        Raises:
+            requests.RequestException if the request fails.
+        """
+        key = (path, tuple(sorted(params.items())))
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        response = self.session.get(self.api_url + path, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+
+        if self.cache_size:
+            with self.cache_lock:
+                self.cache[key] = data
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return data
+
+    def get_commits(self, project_id, before, after, count):
+        """Get the commits between two commits.
+
+        All pages are fetched concurrently. Pages that cannot be fetched are
+        logged and skipped.
+
+        Args:
+            project_id - The GitLab project id.
+            before - The commit before the first commit, or NULL_COMMIT_ID.
+            after - The last commit.
+            count - The number of commits between before and after.
+        Returns:
+            A list of commits, newest first, as returned by the API.
+        """
+        path = '/projects/{}/repository/commits'.format(project_id)
+        ref_name = after if before == NULL_COMMIT_ID else '{}..{}'.format(before, after)
+
+        def get_page(page):
+            try:
+                return self.get(path, {'ref_name': ref_name, 'per_page': self.per_page, 'page': page})
+            except (requests.RequestException, ValueError) as e:
+                self.log.error('Could not get page {} of commits {} of project {}: {}.'.format(
+                    page, ref_name, project_id, e))
+                return []
+
+        pages = math.ceil(count / self.per_page)
+        result = []
+        for commits in self.executor.map(get_page, range(1, pages + 1)):
+            result.extend(commits)
+        return result[:count]
+
+
+class GitlabWorker(Thread):
+    """The GitLab worker, it fetches the missing commits of truncated pushes."""
+
+    def __init__(self, config, gitlab_queue, commit_queue):
+        """init."""
+        Thread.__init__(self)
+        self.config = config
+        self.queue = gitlab_queue
+        self.commit_queue = commit_queue
+        self.client = GitlabClient(config)
+        self.log = logging.getLogger(__class__.__name__)
+
+    def run(self):
+        """Thread main loop."""
+        while True:
+            push = self.queue.get()
+            self.log.debug('Start processing truncated push {before}..{after} of {project}.'.format(**push))
+
+            self.process(push)
+
+            self.log.info('Finished processing truncated push {before}..{after} of {project}.'.format(**push))
+            self.queue.task_done()
+
+    def process(self, push):
+        """Fetch the missing commits of a truncated push and queue them."""
+        trace = get_trace(push)
+        with trace.span('enrich'):
+            api_commits = self.client.get_commits(push['project_id'], push['before'], push['after'], push['push_size'])
+            commits = utils.extract_gitlab_api_commit_data(push, api_commits)
+
+        if commits:
+            self.commit_queue.put(tuple(commits))
+        self.log.info('Fetched {} missing commits of {project}.'.format(len(commits), **push))
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
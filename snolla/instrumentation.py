@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from threading import Lock, enumerate as enumerate_threads, get_ident
+import logging
+import os
+import sys
+import time
+import uuid
+
+
+class Trace():
+    """The trace of a single GitLab delivery.
+
+    A trace is shared by all commits and tasks derived from a delivery and logs
+    the duration of each span with the correlation id of the delivery."""
+
+    __slots__ = ('id', 'log')
+
+    def __init__(self, correlation_id=None):
+        """Setup the trace.
+
+        Args:
+            correlation_id - The correlation id, a random id is used if None.
+        """
+        self.id = correlation_id or uuid.uuid4().hex
+        self.log = logging.getLogger(__class__.__name__)
+
+    def emit(self, name, duration):
+        """Log the duration of a span in seconds."""
+        self.log.info('Trace {}: {} took {:.3f} ms.'.format(self.id, name, duration * 1000))
+
+    @contextmanager
+    def span(self, name):
+        """A context manager that measures the enclosed block as span."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.emit(name, time.perf_counter() - start)
+
+    def __repr__(self):
+        return 'Trace({!r})'.format(self.id)
+
+
+class NullTrace():
+    """A trace that does nothing, used if tracing is disabled."""
+
+    __slots__ = ()
+
+    _span = nullcontext()
+
+    def span(self, name):
+        return self._span
+
+    def emit(self, name, duration):
+        pass
+
+    def __repr__(self):
+        return 'NullTrace()'
+
+NULL_TRACE = NullTrace()
+
+
+def get_trace(item):
+    """Get the trace of a commit or NULL_TRACE if it has none."""
+    return getattr(item, 'trace', NULL_TRACE)
+
+
+class SamplingProfiler():
+    """A sampling profiler for all threads of the process.
+
+    The stack of each thread is sampled periodically. The samples are returned
+    as collapsed stacks, as used to render flame graphs."""
+
+    def __init__(self, interval):
+        """Setup the profiler.
+
+        Args:
+            interval - The sampling interval in seconds.
+        """
+        self.interval = interval
+        self.lock = Lock()
+
+    def sample(self, stacks):
+        """Take a single sample of all threads except the current one."""
+        names = {thread.ident: thread.name for thread in enumerate_threads()}
+        current = get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == current:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            stacks[';'.join(reversed(stack))] += 1
+
+    def profile(self, seconds):
+        """Sample all threads for the given number of seconds.
+
+        Returns:
+            A Counter with the number of samples per collapsed stack or None if
+            another profile is running.
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            stacks = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                self.sample(stacks)
+                time.sleep(self.interval)
+            return stacks
+        finally:
+            self.lock.release()
+
+
+def format_collapsed_stacks(stacks):
+    """Format collapsed stacks, one '<stack> <samples>' per line."""
+    return ''.join('{} {}\n'.format(stack, samples) for stack, samples in sorted(stacks.items()))
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
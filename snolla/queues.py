@@ -0,0 +1,235 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from collections import deque
+from itertools import count
+import heapq
+from queue import Empty, Queue
+from threading import local
+import time
+
+import snolla.utils as utils
+
+class LatencyStats():
+    """Queue latencies of a scheduling class.
+
+    Percentiles are computed over the most recent samples."""
+
+    def __init__(self, samples=1000):
+        """Setup the statistics for the given number of recent samples.
+
+        All samples are kept if samples is None."""
+        self.count = 0
+        self.samples = deque(maxlen=samples)
+
+    def add(self, latency):
+        """Add the latency of a dequeued item in seconds."""
+        self.count += 1
+        self.samples.append(latency)
+
+    def stats(self):
+        """Get the statistics as a dictionary, latencies are in seconds."""
+        samples = sorted(self.samples)
+        if not samples:
+            return {'count': self.count, 'p50': None, 'p95': None, 'max': None}
+        return {
+            'count': self.count,
+            'p50': samples[(len(samples) - 1) // 2],
+            'p95': samples[(len(samples) - 1) * 95 // 100],
+            'max': samples[-1],
+            }
+
+
+class SchedulingQueue(Queue):
+    """A priority scheduler with weighted fair dequeuing between classes.
+
+    Each item is assigned to a class when it is put on the queue. Items of the
+    same class are dequeued in the order they are ready, ie. in FIFO order
+    unless they are held back. Between classes with waiting items,
+    items are dequeued with smooth weighted round robin: a class with weight 8
+    gets eight items dequeued for each item of a class with weight 1, so all
+    classes make progress.
+
+    An item may be held back for a delay after it is put, eg. to back off
+    retries. A class whose next item is not ready yet is idle until then."""
+
+    def __init__(self, classify, weights, maxsize=0, delay=None):
+        """Setup the queue.
+
+        Args:
+            classify - A callable that returns the class of an item.
+            weights - The weight of each class, eg. {'interactive': 8, 'bulk': 1}.
+            maxsize - The maximum size of the queue, see queue.Queue.
+            delay - A callable that returns the seconds an item is held back
+                    after it is put, no item is held back if None.
+        """
+        self.classify = classify
+        self.weights = weights
+        self.delay = delay or (lambda item: 0)
+        Queue.__init__(self, maxsize)
+
+    def _init(self, maxsize):
+        self.size = 0
+        # A heap of (ready time, sequence number, item) per class.
+        self.classes = {name: [] for name in self.weights}
+        self.sequence = count()
+        self.credits = {name: 0 for name in self.weights}
+        self.latencies = {name: LatencyStats() for name in self.weights}
+        self.dequeued = local()
+
+    def _qsize(self):
+        return self.size
+
+    def _put(self, item):
+        self._append(self.classify(item), item, self.delay(item))
+
+    def _append(self, name, item, delay=0):
+        """Append an item to a class, with the time it is ready to be dequeued."""
+        heapq.heappush(self.classes[name], (time.monotonic() + delay, next(self.sequence), item))
+        self.size += 1
+
+    def _get(self):
+        name = self._next_class()
+        ready, _, item = heapq.heappop(self.classes[name])
+        self.size -= 1
+        self.dequeued.wait = time.monotonic() - ready
+        self.latencies[name].add(self.dequeued.wait)
+        return item
+
+    def _ready_in(self):
+        """Get the seconds until the next item is ready, 0 if an item is ready
+        or None if the queue is empty."""
+        heads = [items[0][0] for items in self.classes.values() if items]
+        if not heads:
+            return None
+        return max(0, min(heads) - time.monotonic())
+
+    def get(self, block=True, timeout=None):
+        """Remove and return the next ready item, see queue.Queue.get.
+
+        Items that are held back are not ready before their delay passed, so
+        a blocking get waits for them."""
+        with self.not_empty:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                wait = self._ready_in()
+                if wait == 0:
+                    break
+                if not block:
+                    raise Empty
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Empty
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.not_empty.wait(wait)
+            item = self._get()
+            self.not_full.notify()
+            return item
+
+    def _next_class(self):
+        """Pick the next class with ready items, by smooth weighted round robin."""
+        now = time.monotonic()
+        total = 0
+        best = None
+        for name, items in self.classes.items():
+            if not items or items[0][0] > now:
+                # Idle classes do not accumulate credits.
+                self.credits[name] = 0
+                continue
+            self.credits[name] += self.weights[name]
+            total += self.weights[name]
+            if best is None or self.credits[name] > self.credits[best]:
+                best = name
+        self.credits[best] -= total
+        return best
+
+    def wait(self):
+        """Get the time in seconds the item last dequeued by the calling thread
+        waited in the queue since it was ready.
+
+        A coalesced item waited since its first put."""
+        return getattr(self.dequeued, 'wait', 0.0)
+
+    def stats(self):
+        """Get the number of waiting items and the latencies of each class."""
+        with self.mutex:
+            return {name: dict(self.latencies[name].stats(), waiting=len(items))
+                    for name, items in self.classes.items()}
+
+
+class CoalescingQueue(SchedulingQueue):
+    """A queue for Bugzilla updates that coalesces duplicate updates in flight.
+
+    When the same commits are pushed to several origins, eg. to a bugfix branch
+    and to master, the same tasks are created for each push. If a task for the
+    same bug, commit and Bugzilla task is still waiting in the queue, the new
+    update is merged into the waiting update instead of being queued again,
+    see utils.merge_bugzilla_updates. The merged update lists all origins and
+    also gets the tasks of the new update that were not waiting yet, so each
+    task is waiting in a single update. Retried updates are only coalesced
+    with updates of the same attempt."""
+
+    def __init__(self, classify, weights, maxsize=0, delay=None, order=None):
+        """Setup the queue.
+
+        Args:
+            classify, weights, maxsize, delay - See SchedulingQueue.
+            order - The order of each Bugzilla task, see
+                    utils.get_task_order_from_config.
+        """
+        self.order = order
+        SchedulingQueue.__init__(self, classify, weights, maxsize, delay)
+
+    def _init(self, maxsize):
+        SchedulingQueue._init(self, maxsize)
+        # The coalescing table with the waiting update per key, and the keys
+        # of the waiting updates per bug and attempt. The classes only hold
+        # the keys.
+        self.pending = dict()
+        self.waiting = dict()
+        self.keys = count()
+
+    def _put(self, update):
+        bug = (update['bugid'], update['attempt'])
+        task_keys = [(task['commit']['id'], task['task']) for task in update['tasks']]
+
+        # Find the waiting update of each task among the waiting updates of
+        # the bug, if any. This runs for every put, so fields are read as
+        # attributes and only tasks of the same commits are compared.
+        targets = dict()
+        remaining = dict.fromkeys(task_keys)
+        commit_ids = frozenset(commit_id for commit_id, _ in task_keys)
+        for key in self.waiting.get(bug, ()):
+            for task in self.pending[key].tasks:
+                if task.commit.id in commit_ids and remaining.get((task.commit.id, task.task), key) is None:
+                    remaining[task.commit.id, task.task] = key
+                    targets.setdefault(key, [])
+
+        if not targets:
+            key = next(self.keys)
+            self.pending[key] = update
+            self.waiting.setdefault(bug, []).append(key)
+            self._append(self.classify(update), key, self.delay(update))
+            return
+
+        # Tasks that are not waiting yet are added to the first waiting update.
+        first = next(iter(targets))
+        for task_key, task in zip(task_keys, update['tasks']):
+            targets[remaining[task_key] if remaining[task_key] is not None else first].append(task)
+        for key, tasks in targets.items():
+            self.pending[key] = utils.merge_bugzilla_updates(self.pending[key], update.replace(tasks=tuple(tasks)),
+                    self.order)
+        # Queue.put counts each item as unfinished, a merged update is not.
+        self.unfinished_tasks -= 1
+
+    def _get(self):
+        key = SchedulingQueue._get(self)
+        update = self.pending.pop(key)
+        bug = (update['bugid'], update['attempt'])
+        self.waiting[bug].remove(key)
+        if not self.waiting[bug]:
+            del self.waiting[bug]
+        return update
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
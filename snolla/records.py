@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+class Record():
+    """An immutable, slotted record.
+
+    Records store their fields in __slots__ instead of a per-instance dict and
+    support read-only mapping access. This way a record may be used in place of
+    the plain dicts that were passed around before, eg. commit['id'] or
+    template.format(**commit) continue to work.
+
+    Records are compared and hashed by value, except for the fields in
+    _uncompared, eg. a trace."""
+
+    __slots__ = ()
+
+    _uncompared = ()
+
+    def __init__(self, **fields):
+        """Set all fields of the record.
+
+        Raises:
+            TypeError if a field is missing or unknown."""
+        for name in self.__slots__:
+            try:
+                object.__setattr__(self, name, fields.pop(name))
+            except KeyError:
+                raise TypeError('Missing field "{}" for {}.'.format(name, type(self).__name__))
+        if fields:
+            raise TypeError('Unknown fields for {}: {}.'.format(type(self).__name__, ', '.join(sorted(fields))))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is immutable.'.format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError('{} is immutable.'.format(type(self).__name__))
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def keys(self):
+        """The field names of the record."""
+        return self.__slots__
+
+    def values(self):
+        """The field values of the record."""
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def replace(self, **fields):
+        """Return a new record with the given fields replaced."""
+        return type(self)(**dict(self, **fields))
+
+    def _compared_values(self):
+        """The field values that are compared and hashed."""
+        return tuple(getattr(self, name) for name in self.__slots__ if name not in self._uncompared)
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return self._compared_values() == other._compared_values()
+
+    def __hash__(self):
+        return hash(self._compared_values())
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__,
+                ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class Commit(Record):
+    """A commit in snolla format, as stored in commit_queue.
+
+    Fields:
+        id - The commit id.
+        project - The GitLab project path with namespace, eg. group/project.
+        origin - The short git refspec, eg. master.
+        origins - A tuple of all origins the commit was pushed to, the origin
+                  first. Coalesced commits list more than one origin.
+        message - The commit message.
+        timestamp - The iso 8601 timestamp with utc offset.
+        url - The url to the online diff of this commit.
+        author_name - The author name.
+        author_email - The author email.
+        push_size - The number of commits in the push, used for scheduling.
+        trace - The trace of the delivery, see snolla.instrumentation.
+    """
+
+    __slots__ = ('id', 'project', 'origin', 'origins', 'message', 'timestamp', 'url', 'author_name', 'author_email', 'push_size', 'trace')
+
+    _uncompared = ('trace',)
+
+
+class TruncatedPush(Record):
+    """A push whose list of commits was truncated by GitLab.
+
+    The missing commits are fetched from the GitLab API by the GitLab worker.
+
+    Fields:
+        project_id - The GitLab project id.
+        project - The GitLab project path with namespace.
+        project_url - The url of the GitLab project.
+        origin - The short git refspec, eg. master.
+        before - The commit id before the push.
+        after - The commit id after the push.
+        push_size - The total number of commits in the push.
+        known_ids - A frozenset of the ids of the commits sent with the push.
+        trace - The trace of the delivery, see snolla.instrumentation.
+    """
+
+    __slots__ = ('project_id', 'project', 'project_url', 'origin', 'before', 'after', 'push_size', 'known_ids', 'trace')
+
+    _uncompared = ('trace',)
+
+
+class Delivery(Record):
+    """A captured HTTP request, see snolla.capture.
+
+    Fields:
+        timestamp - The arrival time as unix timestamp.
+        method - The HTTP method.
+        path - The path of the request.
+        query_string - The query string of the request.
+        headers - A tuple of (name, value) tuples.
+        body - The body as bytes.
+    """
+
+    __slots__ = ('timestamp', 'method', 'path', 'query_string', 'headers', 'body')
+
+
+class Task(Record):
+    """A single Bugzilla task, derived from an action in a commit message.
+
+    All tasks derived from the same commit share a reference to a single
+    Commit record.
+
+    Fields:
+        task - The bugzilla task, eg. comment.
+        bugid - The bugid.
+        commit - The commit record.
+    """
+
+    __slots__ = ('task', 'bugid', 'commit')
+
+
+class Update(Record):
+    """An update of a bug for the Bugzilla worker, as stored in
+    bugzilla_task_queue.
+
+    An update combines all tasks of a push for the same bug, so they are sent
+    to Bugzilla in a single call.
+
+    Fields:
+        bugid - The bugid.
+        tasks - A tuple of Task records, in the order they are applied.
+        attempt - The number of failed attempts, 0 for a new update.
+    """
+
+    __slots__ = ('bugid', 'tasks', 'attempt')
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
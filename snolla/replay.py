@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+"""Replay a capture file against snolla with a fake Bugzilla backend.
+
+The deliveries of a capture (see snolla.capture) are fed into the wsgi app at
+their original pace, N times faster or as fast as possible. Bugzilla is not
+called, each call takes a fixed latency instead. When all queues are drained,
+the throughput and the latency distributions are reported.
+
+Run from the top level directory:
+    python -m snolla.replay --config /etc/snolla.conf [--speed N|max] <capture file>
+"""
+
+from collections import Counter
+from functools import partial
+from threading import Lock
+from werkzeug.test import EnvironBuilder
+import argparse
+import logging
+import sys
+import time
+
+from snolla import create_frontend, load_config
+from snolla.bugzilla import BugzillaWorker
+from snolla.capture import read_capture
+from snolla.queues import LatencyStats
+
+
+class FakeBugzilla():
+    """A fake Bugzilla backend, it counts the calls of all workers."""
+
+    def __init__(self, latency):
+        """Setup the backend with a latency per call in seconds."""
+        self.latency = latency
+        self.calls = 0
+        self.lock = Lock()
+
+    def call(self, args):
+        """Take a call."""
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+        return True
+
+
+class FakeBugzillaWorker(BugzillaWorker):
+    """A Bugzilla worker that calls a fake Bugzilla backend."""
+
+    def __init__(self, backend, config, bugzilla_task_queue):
+        """init."""
+        BugzillaWorker.__init__(self, config, bugzilla_task_queue)
+        self.backend = backend
+
+    def external_command(self, args):
+        """Call the fake backend instead of python-bugzilla."""
+        return self.backend.call(args)
+
+
+def replay(app, deliveries, speed=None):
+    """Feed deliveries into a wsgi app.
+
+    Args:
+        app - The wsgi app.
+        deliveries - An iterable of Delivery records.
+        speed - The speed relative to the capture, eg. 1 or 10. Deliveries
+                are replayed as fast as possible if None.
+    Returns:
+        A tuple with the request latencies as LatencyStats and a Counter of
+        the response status codes.
+    """
+    latencies = LatencyStats(samples=None)
+    statuses = Counter()
+    start = time.monotonic()
+    first = None
+
+    def start_response(status, headers):
+        statuses[int(status.split(' ', 1)[0])] += 1
+
+    for delivery in deliveries:
+        if speed:
+            if first is None:
+                first = delivery['timestamp']
+            delay = start + (delivery['timestamp'] - first) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        environ = EnvironBuilder(path=delivery['path'], method=delivery['method'],
+                query_string=delivery['query_string'], headers=list(delivery['headers']),
+                data=delivery['body']).get_environ()
+        request_start = time.perf_counter()
+        b''.join(app(environ, start_response))
+        latencies.add(time.perf_counter() - request_start)
+    return latencies, statuses
+
+
+def run(config, capture, speed=None, latency=0.0):
+    """Replay a capture against snolla with a fake Bugzilla backend.
+
+    Fetching commits from GitLab and recording are disabled during a replay.
+
+    Args:
+        config - The parsed configuration.
+        capture - The path of the capture file.
+        speed - The speed relative to the capture, see replay.
+        latency - The latency of each Bugzilla call in seconds.
+    Returns:
+        The report as a dictionary.
+    """
+    config['gitlab']['enabled'] = False
+    config['instrumentation']['capture_path'] = ''
+
+    backend = FakeBugzilla(latency)
+    frontend = create_frontend(config, partial(FakeBugzillaWorker, backend))
+
+    start = time.monotonic()
+    latencies, statuses = replay(frontend, read_capture(capture), speed)
+    replayed = time.monotonic() - start
+
+    for tenant in frontend.queue.tenants:
+        tenant.commit_queue.join()
+    for tenant in frontend.queue.tenants:
+        tenant.bugzilla_task_queue.join()
+    drained = time.monotonic() - start
+
+    return {
+        'deliveries': latencies.count,
+        'replayed': replayed,
+        'drained': drained,
+        'statuses': dict(statuses),
+        'request_latency': latencies.stats(),
+        'bugzilla_calls': backend.calls,
+        'queues': frontend.queue.stats(),
+        }
+
+
+def format_latency(stats):
+    """Format latency statistics in milliseconds."""
+    if not stats['count']:
+        return 'count 0'
+    return 'count {count}, p50 {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms'.format(
+            stats['p50'] * 1000, stats['p95'] * 1000, stats['max'] * 1000, **stats)
+
+
+def format_report(report):
+    """Format a report of run as text."""
+    lines = [
+        'Replayed {} deliveries in {:.2f} s ({:.1f} deliveries/s).'.format(
+            report['deliveries'], report['replayed'], report['deliveries'] / max(report['replayed'], 1e-9)),
+        'Responses: {}.'.format(', '.join('{}: {}'.format(status, count)
+            for status, count in sorted(report['statuses'].items()))),
+        'Request latency: {}.'.format(format_latency(report['request_latency'])),
+        'Drained all queues after {:.2f} s, {} Bugzilla calls ({:.1f} calls/s).'.format(
+            report['drained'], report['bugzilla_calls'], report['bugzilla_calls'] / max(report['drained'], 1e-9)),
+        'Queue latency:',
+        ]
+    for tenant, queues in sorted(report['queues'].items()):
+        for queue, classes in sorted(queues.items()):
+            for name, stats in sorted(classes.items()):
+                lines.append('  {} {} {}: {}.'.format(tenant, queue, name, format_latency(stats)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """Parse the arguments, replay the capture and print the report."""
+    parser = argparse.ArgumentParser(description='Replay a capture file against snolla with a fake Bugzilla.')
+    parser.add_argument('capture', help='the capture file')
+    parser.add_argument('--config', default='/etc/snolla.conf', help='the configuration file')
+    parser.add_argument('--speed', default='1',
+            help='the speed relative to the capture, eg. 1 or 10, or max (default: 1)')
+    parser.add_argument('--latency', type=float, default=50,
+            help='the latency of each Bugzilla call in milliseconds (default: 50)')
+    args = parser.parse_args(argv)
+
+    speed = None if args.speed == 'max' else float(args.speed)
+    if speed is not None and speed <= 0:
+        parser.error('The speed must be positive or max.')
+
+    valid, config = load_config(args.config, configspec='config/snolla.conf.spec')
+    if not valid:
+        print('The supplied configuration is invalid.')
+        sys.exit(1)
+    logging.basicConfig(level=logging.ERROR)
+
+    print(format_report(run(config, args.capture, speed, args.latency / 1000)))
+
+if __name__ == '__main__':
+    main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
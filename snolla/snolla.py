@@ -4,6 +4,7 @@
 from threading import Thread
 import logging
 
+from snolla.instrumentation import get_trace
 import snolla.utils as utils
 
 class SnollaWorker(Thread):
@@ -19,28 +20,52 @@ class SnollaWorker(Thread):
     def run(self):
         """Thread main loop."""
         while True:
-            commit = self.commit_queue.get()
-            self.log.debug('Start processing commit {id}.'.format(**commit))
+            commits = self.commit_queue.get()
+            trace = get_trace(commits[0])
+            trace.emit('commit queue wait', self.commit_queue.wait())
+            self.log.debug('Start processing {} commits of {project}.'.format(len(commits), **commits[0]))
 
-            self.process(commit)
+            with trace.span('process'):
+                self.process(commits)
 
-            self.log.info('Finished processing commit {id}.'.format(**commit))
+            self.log.info('Finished processing {} commits of {project}.'.format(len(commits), **commits[0]))
             self.commit_queue.task_done()
 
-    def process(self, commit):
-        """Process a commit."""
-        if not self.check_allowed_origins(commit):
+    def process(self, commits):
+        """Process the commits of a push.
+
+        The Bugzilla tasks of all commits are merged into a single update per
+        bug, see utils.create_bugzilla_updates."""
+        tasks = []
+        for commit in commits:
+            tasks.extend(self.process_commit(commit))
+        if not tasks:
             return
 
+        for update in utils.create_bugzilla_updates(tasks, utils.get_task_order_from_config(self.config)):
+            self.log.info('Queueing {} tasks for bug {bugid}.'.format(len(update['tasks']), **update))
+            self.bugzilla_task_queue.put(update)
+
+    def process_commit(self, commit):
+        """Process a commit.
+
+        Return a list with the Bugzilla tasks of the commit."""
+        if not self.check_allowed_origins(commit):
+            return []
+
         # Extract action and bugid from commit.
         action_list = utils.extract_actions(commit['message'], self.config['general']['extract_regex'])
         if not action_list:
             self.log.warning('Could not find any action/bugid in commit {id}.'.format(**commit))
-            return
+            return []
 
         # Handle extracted actions
+        tasks = []
         for action, bugid in action_list:
-            self.handle_extracted_action(action, bugid, commit)
+            task = self.handle_extracted_action(action, bugid, commit)
+            if task:
+                tasks.append(task)
+        return tasks
 
     def check_allowed_origins(self, commit):
         """Check if the origin is allowed.
@@ -54,15 +79,18 @@ class SnollaWorker(Thread):
         return True
 
     def handle_extracted_action(self, action, bugid, commit):
-        """Handle a single extracted action and bugid."""
+        """Handle a single extracted action and bugid.
+
+        Return the Bugzilla task for the action or None if there is none."""
         self.log.info('Found action "{}" for bug id {}.'.format(action, bugid))
 
         # Find suitable Bugzilla tasks for the extracted action.
         task = utils.get_bugzilla_task_for_action(action, utils.get_task_dict_from_config(self.config))
         if task:
             self.log.info('The action "{}" matches the Bugzilla task {}.'.format(action, task))
-            self.bugzilla_task_queue.put(utils.create_bugzilla_task(task, bugid, commit))
-        else:
-            self.log.warning('The action "{}" does not match any Bugzilla task.'.format(action))
+            return utils.create_bugzilla_task(task, bugid, commit)
+
+        self.log.warning('The action "{}" does not match any Bugzilla task.'.format(action))
+        return None
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from functools import lru_cache, partial
+import logging
+
+from snolla.bugzilla import BugzillaWorker
+from snolla.queues import CoalescingQueue, SchedulingQueue
+from snolla.snolla import SnollaWorker
+import snolla.utils as utils
+
+# The name of the tenant that is used if no tenants are configured.
+DEFAULT_TENANT = 'default'
+
+# The number of projects whose tenant is cached by the router.
+ROUTE_CACHE_SIZE = 1024
+
+# The settings of tenant tasks that are not in the [tasks] section.
+TASK_DEFAULTS = {
+    'keywords': [],
+    'template': '',
+    'order': 0,
+    'status': 'RESOLVED',
+    'resolution': 'FIXED',
+    'add': [],
+    'remove': [],
+    }
+
+
+def get_tenant_config(config, name):
+    """Get the configuration of a tenant.
+
+    Settings of the tenant override the settings of the [general] and
+    [bugzilla] sections. The tasks of the tenant replace the [tasks] section,
+    if the tenant defines any. Settings missing in a task of the tenant are
+    taken from the same task in the [tasks] section, or from TASK_DEFAULTS.
+    The [scheduling] section applies to all tenants.
+
+    Args:
+        config - The parsed configuration.
+        name - The name of the tenant in the [tenants] section.
+    Returns:
+        A configuration with the sections general, tasks, bugzilla and
+        scheduling, as expected by the Snolla and Bugzilla workers.
+    """
+    tenant = config['tenants'][name]
+
+    general = dict(config['general'])
+    for key in ('allowed_origins', 'extract_regex'):
+        if tenant[key] is not None:
+            general[key] = tenant[key]
+
+    bugzilla = dict(config['bugzilla'])
+    bugzilla.update((key, value) for key, value in tenant['bugzilla'].items() if value is not None)
+
+    tasks = config['tasks']
+    if tenant['tasks'].sections:
+        tasks = tenant['tasks']
+        for task in tasks.sections:
+            defaults = config['tasks'][task] if task in config['tasks'] else dict()
+            for key, value in tasks[task].items():
+                if value is None:
+                    value = defaults.get(key)
+                    tasks[task][key] = TASK_DEFAULTS[key] if value is None else value
+
+    return {'general': general, 'tasks': tasks, 'bugzilla': bugzilla, 'scheduling': config['scheduling']}
+
+
+def create_tenants(config):
+    """Create all tenants from the configuration.
+
+    If the [tenants] section is empty, a single tenant serves all projects with
+    the [general], [tasks] and [bugzilla] sections.
+
+    Returns:
+        A list of tenants, in the order of the configuration.
+    """
+    if not config['tenants'].sections:
+        return [Tenant(DEFAULT_TENANT, config, ('',))]
+
+    return [Tenant(name, get_tenant_config(config, name), config['tenants'][name]['projects'])
+            for name in config['tenants'].sections]
+
+
+class Tenant():
+    """A tenant: some GitLab projects linked to a single Bugzilla instance.
+
+    Each tenant has its own queues, its own Snolla worker and its own pool of
+    Bugzilla workers, so a slow Bugzilla instance only delays its own
+    tenant. The queues schedule interactive work before bulk work, see
+    utils.get_push_class and utils.get_update_class."""
+
+    def __init__(self, name, config, projects):
+        """Setup the tenant.
+
+        Args:
+            name - The name of the tenant.
+            config - The configuration of the tenant.
+            projects - The project paths and namespaces served by the tenant.
+                       The empty namespace '' serves all projects.
+        """
+        self.name = name
+        self.config = config
+        self.projects = projects
+        scheduling = config['scheduling']
+        weights = utils.get_scheduling_weights(scheduling)
+        self.commit_queue = SchedulingQueue(partial(utils.get_push_class, scheduling=scheduling), weights)
+        self.bugzilla_task_queue = CoalescingQueue(partial(utils.get_update_class, scheduling=scheduling), weights,
+                delay=partial(utils.get_update_delay, retry_delay=config['bugzilla']['retry_delay']),
+                order=utils.get_task_order_from_config(config))
+        self.workers = []
+        self.log = logging.getLogger(__class__.__name__)
+
+    def serves(self, project):
+        """Check if the tenant serves the given project."""
+        return '' in self.projects or utils.is_project_served(project, self.projects)
+
+    def start(self, bugzilla_worker=None):
+        """Start the Snolla worker and the pool of Bugzilla workers.
+
+        Args:
+            bugzilla_worker - The class of the Bugzilla workers, BugzillaWorker
+                              if None.
+        """
+        bugzilla_worker = bugzilla_worker or BugzillaWorker
+        self.workers.append(SnollaWorker(self.config, self.commit_queue, self.bugzilla_task_queue))
+        for _ in range(self.config['bugzilla']['workers']):
+            self.workers.append(bugzilla_worker(self.config, self.bugzilla_task_queue))
+
+        for number, worker in enumerate(self.workers):
+            worker.name = '{}-{}-{}'.format(self.name, type(worker).__name__, number)
+            worker.daemon = True
+            worker.start()
+        self.log.info('Started tenant {} with {} Bugzilla workers.'.format(self.name, len(self.workers) - 1))
+
+    def stats(self):
+        """Get the statistics of the queues of the tenant."""
+        return {
+            'commit_queue': self.commit_queue.stats(),
+            'bugzilla_task_queue': self.bugzilla_task_queue.stats(),
+            }
+
+
+class TenantRouter():
+    """Route pushes to the commit queue of the tenant serving their project.
+
+    The router is used as the queue of the frontend."""
+
+    def __init__(self, tenants):
+        """Setup the router for the given tenants."""
+        self.tenants = tenants
+        # Project paths come from web hook bodies, the cache is bounded.
+        self.route = lru_cache(maxsize=ROUTE_CACHE_SIZE)(self.route)
+        self.log = logging.getLogger(__class__.__name__)
+
+    def route(self, project):
+        """Get the tenant for a project.
+
+        The first tenant serving the project wins. Lookups of the recently
+        seen projects are cached, see ROUTE_CACHE_SIZE.
+
+        Returns:
+            The tenant or None if no tenant serves the project.
+        """
+        return next((tenant for tenant in self.tenants if tenant.serves(project)), None)
+
+    def put(self, commits):
+        """Put the commits of a push on the commit queue of its tenant."""
+        tenant = self.route(commits[0]['project'])
+        if tenant is None:
+            self.log.warning('No tenant serves project {project} of commit {id}.'.format(**commits[0]))
+            return
+        tenant.commit_queue.put(commits)
+
+    def stats(self):
+        """Get the statistics of the queues of all tenants."""
+        return {tenant.name: tenant.stats() for tenant in self.tenants}
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
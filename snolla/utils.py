@@ -1,18 +1,16 @@
 #!/usr/bin/python
 # This file is part of snolla. See README for more information.
 
+from urllib.parse import urlsplit
 import re
+import sys
 
-# Format for messages in commit_queue:
-# commit_format = {
-    # "id": "<commit id>",
-    # "origin": "<the short git refspec, eg. master>",
-    # "message": "<commit message>",
-    # "timestamp": "<iso 8601 timestamp with utc offset>",
-    # "url": "<url to online diff of this commit>",
-    # "author_name": "<author name>",
-    # "author_email": "<author email>",
-    # }
+from snolla.instrumentation import NULL_TRACE
+from snolla.records import Commit, Task, TruncatedPush, Update
+
+# Messages in commit_queue are tuples of the snolla.records.Commit records of a
+# single push, messages in bugzilla_task_queue are snolla.records.Update
+# records.
 
 def is_origin_allowed(origin, allowed_origins):
     """
@@ -31,6 +29,22 @@ def is_origin_allowed(origin, allowed_origins):
     return False
 
 
+def is_project_served(project, projects):
+    """
+    Check if the given GitLab project is served by a list of projects.
+
+    The same rules as for origins apply, a project is served if it is listed
+    or if a namespace with a trailing slash is listed, eg. 'group/'.
+
+    Args:
+        project - The project path with namespace to check.
+        projects - An iterable of project paths and namespaces.
+    Returns:
+        True if the project is served, False otherwise.
+    """
+    return is_origin_allowed(project, projects)
+
+
 def extract_actions(message, regex):
     """
     Extract actions and bugids for the given message and return all found
@@ -88,26 +102,134 @@ def get_task_dict_from_config(config):
             config['tasks'].sections if config['tasks'][task].as_bool('enabled')}
 
 
-def extract_gitlab_commit_data(data_dict):
+def get_task_order_from_config(config):
+    """
+    Get the order of the enabled tasks from the configuration.
+
+    Args:
+        config - The parsed configuration.
+    Returns:
+        The order of each task, eg. { 'comment': 10, 'status': 20 }.
+    """
+    return {task: config['tasks'][task].as_int('order') for task in
+            config['tasks'].sections if config['tasks'][task].as_bool('enabled')}
+
+
+def extract_gitlab_project_path(data_dict):
+    """Extract the project path with namespace from a parsed gitlab json message.
+
+    Older GitLab versions do not send the project section, the path is taken
+    from the repository homepage in that case.
+
+    Returns:
+        The project path, eg. 'group/project'.
+    Raises:
+        KeyError in case one of the expected keys is not present.
+    """
+    if 'project' in data_dict:
+        path = data_dict['project']['path_with_namespace']
+    else:
+        path = urlsplit(data_dict['repository']['homepage']).path.strip('/')
+    return sys.intern(path)
+
+
+def extract_gitlab_commit_data(data_dict, trace=NULL_TRACE):
     """Extract commit data from a parsed gitlab push json message.
 
+    The project, the origin and the author strings are interned, as they are usually the
+    same for many commits. All commits share the trace of the delivery. The
+    push size is the total number of commits, as GitLab truncates the list of
+    commits for large pushes.
+
     Returns:
-        A list of commits in snolla format.
+        A list of Commit records.
     Raises:
         KeyError in case one of the expected keys is not present.
     """
     result = []
-    origin = re.sub(r'^refs/heads/', '', data_dict['ref'])
+    project = extract_gitlab_project_path(data_dict)
+    origin = sys.intern(re.sub(r'^refs/heads/', '', data_dict['ref']))
+    push_size = data_dict.get('total_commits_count', len(data_dict['commits']))
     for commit in data_dict['commits']:
-        result.append({
-                'id': commit['id'],
-                'origin': origin,
-                'message': commit['message'],
-                'timestamp': commit['timestamp'],
-                'url': commit['url'],
-                'author_name': commit['author']['name'],
-                'author_email': commit['author']['email'],
-            })
+        result.append(Commit(
+                id=commit['id'],
+                project=project,
+                origin=origin,
+                origins=(origin,),
+                message=commit['message'],
+                timestamp=commit['timestamp'],
+                url=commit['url'],
+                author_name=sys.intern(commit['author']['name']),
+                author_email=sys.intern(commit['author']['email']),
+                push_size=push_size,
+                trace=trace,
+            ))
+    return result
+
+
+def extract_gitlab_truncated_push(data_dict, trace=NULL_TRACE):
+    """Detect a truncated list of commits in a parsed gitlab push json message.
+
+    GitLab only sends a limited number of commits with a push, the total
+    number of commits is sent as total_commits_count.
+
+    Returns:
+        A TruncatedPush record if commits are missing, None otherwise.
+    Raises:
+        KeyError in case one of the expected keys is not present.
+    """
+    push_size = data_dict.get('total_commits_count', 0)
+    if push_size <= len(data_dict['commits']):
+        return None
+
+    if 'project' in data_dict:
+        project_url = data_dict['project']['web_url']
+    else:
+        project_url = data_dict['repository']['homepage']
+
+    return TruncatedPush(
+            project_id=data_dict['project_id'],
+            project=extract_gitlab_project_path(data_dict),
+            project_url=project_url,
+            origin=sys.intern(re.sub(r'^refs/heads/', '', data_dict['ref'])),
+            before=data_dict['before'],
+            after=data_dict['after'],
+            push_size=push_size,
+            known_ids=frozenset(commit['id'] for commit in data_dict['commits']),
+            trace=trace,
+        )
+
+
+def extract_gitlab_api_commit_data(push, api_commits):
+    """Extract the missing commits of a truncated push from the GitLab API.
+
+    Args:
+        push - The TruncatedPush record.
+        api_commits - The commits as returned by the GitLab commits API,
+                      newest first.
+    Returns:
+        A list of Commit records for the commits that were not sent with the
+        push, oldest first.
+    Raises:
+        KeyError in case one of the expected keys is not present.
+    """
+    result = []
+    for commit in reversed(api_commits):
+        if commit['id'] in push['known_ids']:
+            continue
+        result.append(Commit(
+                id=commit['id'],
+                project=push['project'],
+                origin=push['origin'],
+                origins=(push['origin'],),
+                message=commit['message'],
+                timestamp=commit['authored_date'],
+                url=commit.get('web_url') or '{}/commit/{}'.format(push['project_url'], commit['id']),
+                author_name=sys.intern(commit['author_name']),
+                author_email=sys.intern(commit['author_email']),
+                push_size=push['push_size'],
+                trace=push['trace'],
+            ))
     return result
 
 
@@ -117,14 +239,164 @@ def create_bugzilla_task(task, bugid, commit):
     Args:
         task - The bugzilla task.
         bugid - The bugid.
-        commit - The commit dict, that contains the keys as specified in tpl.
+        commit - The commit record, that contains the keys as specified in tpl.
+                 It is referenced, not copied.
+    Returns:
+        A Task record with the fields task, bugid and commit.
+    """
+    return Task(task=task, bugid=bugid, commit=commit)
+
+
+def create_bugzilla_updates(tasks, order):
+    """Merge the tasks of a push into a single update per bug.
+
+    The tasks of an update are sorted by the order of their Bugzilla task and
+    by their position in the push, duplicate tasks for the same commit are
+    dropped.
+
+    Args:
+        tasks - An iterable of Task records, in the order of the push.
+        order - The order of each Bugzilla task, see get_task_order_from_config.
+    Returns:
+        A list of Update records, one for each bug in the order the bugs were
+        first seen.
+    """
+    bugs = dict()
+    for task in tasks:
+        bug_tasks = bugs.setdefault(task['bugid'], dict())
+        bug_tasks.setdefault((task['commit']['id'], task['task']), task)
+
+    return [Update(bugid=bugid, tasks=tuple(sorted(bug_tasks.values(), key=lambda task: order.get(task['task'], 0))),
+            attempt=0) for bugid, bug_tasks in bugs.items()]
+
+
+def format_commit(template, commit):
+    """Format a template with the fields of a commit.
+
+    The field origin lists all origins of the commit, separated by a comma,
+    eg. 'bugfix/x, master'.
+    """
+    return template.format(**dict(commit, origin=', '.join(commit['origins'])))
+
+
+def get_commit_class(commit, scheduling):
+    """Get the scheduling class of a commit.
+
+    Commits of large pushes, eg. imports or mass rebases, are bulk work. Commits
+    of other pushes are interactive if their origin matches the interactive
+    origins and bulk work otherwise.
+
+    Args:
+        commit - The commit.
+        scheduling - The scheduling section of the configuration.
+    Returns:
+        The scheduling class: 'interactive' or 'bulk'.
+    """
+    if commit['push_size'] > scheduling['bulk_push_size']:
+        return 'bulk'
+    if is_origin_allowed(commit['origin'], scheduling['interactive_origins']):
+        return 'interactive'
+    return 'bulk'
+
+
+def get_push_class(commits, scheduling):
+    """Get the scheduling class of the commits of a push.
+
+    All commits of a push share their origin and push size, so the push is in
+    the class of its first commit, see get_commit_class.
+    """
+    return get_commit_class(commits[0], scheduling)
+
+
+def get_update_class(update, scheduling):
+    """Get the scheduling class of a Bugzilla update.
+
+    Retried updates are in the class 'retry', all other updates are in the
+    class of the commit of their first task.
+
+    Args:
+        update - The Bugzilla update.
+        scheduling - The scheduling section of the configuration.
+    Returns:
+        The scheduling class: 'interactive', 'bulk' or 'retry'.
+    """
+    if update['attempt']:
+        return 'retry'
+    return get_commit_class(update['tasks'][0]['commit'], scheduling)
+
+
+def get_update_delay(update, retry_delay):
+    """Get the seconds a Bugzilla update is held back in the queue.
+
+    New updates are not held back. Retried updates back off exponentially:
+    the first retry waits retry_delay seconds and each further retry waits
+    twice as long as the one before.
+
+    Args:
+        update - The Bugzilla update.
+        retry_delay - The delay of the first retry in seconds.
+    Returns:
+        The delay in seconds.
+    """
+    if not update['attempt']:
+        return 0
+    return retry_delay * 2 ** (update['attempt'] - 1)
+
+
+def get_scheduling_weights(scheduling):
+    """Get the weight of each scheduling class from the configuration.
+
+    Returns:
+        A dictionary, eg. {'interactive': 8, 'bulk': 1, 'retry': 1}.
+    """
+    return {name: scheduling['{}_weight'.format(name)] for name in ('interactive', 'bulk', 'retry')}
+
+
+def merge_bugzilla_tasks(task, other):
+    """Merge two tasks for the same commit, bug and Bugzilla task.
+
+    The same commit may be pushed to several origins, eg. to a bugfix branch
+    and to master. The commit of the merged task keeps its origin and lists
+    the origins of both tasks in origins, in the order they were seen.
+
+    Args:
+        task - The task seen first.
+        other - The task seen later.
     Returns:
-        A dictionary: {'task': ..., 'bugid': ..., 'commit': ...}
+        A task with the commit of task, listing the origins of both tasks.
     """
-    return {
-        'bugid': bugid,
-        'commit': commit,
-        'task': task,
-        }
+    origins = task['commit']['origins']
+    new_origins = tuple(origin for origin in other['commit']['origins'] if origin not in origins)
+    if not new_origins:
+        return task
+    return task.replace(commit=task['commit'].replace(origins=origins + new_origins))
+
+
+def merge_bugzilla_updates(update, other, order=None):
+    """Merge two updates of the same bug.
+
+    Tasks for the same commit and Bugzilla task are merged, see
+    merge_bugzilla_tasks. The other tasks of other are added, and the tasks
+    are sorted by the order of their Bugzilla task again.
+
+    Args:
+        update - The update seen first.
+        other - The update seen later.
+        order - The order of each Bugzilla task, see get_task_order_from_config.
+                Added tasks are appended if None.
+    Returns:
+        An update with the tasks of both updates, listing the origins of both
+        updates.
+    """
+    order = order or dict()
+    tasks = dict(((task['commit']['id'], task['task']), task) for task in update['tasks'])
+    for task in other['tasks']:
+        key = (task['commit']['id'], task['task'])
+        tasks[key] = merge_bugzilla_tasks(tasks[key], task) if key in tasks else task
+
+    tasks = tuple(sorted(tasks.values(), key=lambda task: order.get(task['task'], 0)))
+    if len(tasks) == len(update['tasks']) and all(task is merged for task, merged in zip(update['tasks'], tasks)):
+        return update
+    return update.replace(tasks=tasks)
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
@@ -7,6 +7,9 @@ import unittest
 import unittest.mock as mock
 
 from snolla.bugzilla import BugzillaWorker
+from snolla.instrumentation import NULL_TRACE
+from snolla.queues import CoalescingQueue
+from snolla.records import Commit, Task, Update
 
 class TestBugzillaWorker(unittest.TestCase):
 
@@ -22,14 +25,41 @@ class TestBugzillaWorker(unittest.TestCase):
                     'url': 'thebugzillaurl',
                     'username': 'username',
                     'password': 'password',
+                    'retries': 0,
                     },
             'tasks': {
                 'comment': {
                     'template': 'x{author_name}y'
-                    }
+                    },
+                'status': {
+                    'status': 'RESOLVED',
+                    'resolution': 'FIXED',
+                    'template': 'fixed by {id}'
+                    },
+                'see_also': {
+                    'template': 'http://localhost/{id}'
+                    },
+                'keywords': {
+                    'add': ['Backport'],
+                    'remove': ['Triaged']
+                    },
+                'whiteboard': {
+                    'template': '[{id}]'
+                    },
                 }
             }
 
+        # A sample commit
+        self.commit = Commit(id='a', project='group/project', origin='master', origins=('master',), message='msg', timestamp='1',
+                url='http://localhost/gitlab/1', author_name='foo bar', author_email='foo@bar.at', push_size=1,
+                trace=NULL_TRACE)
+
+    def task(self, task, commit_id='a'):
+        return Task(task=task, bugid=1, commit=self.commit.replace(id=commit_id))
+
+    def update(self, task):
+        return Update(bugid=1, tasks=(self.task(task),), attempt=0)
+
     @mock.patch('subprocess.check_output')
     def test_external_command_ok(self, mock_output):
         obj = BugzillaWorker(self.cfg, None)
@@ -58,37 +88,116 @@ class TestBugzillaWorker(unittest.TestCase):
 
     def test_check_handlers_present(self):
         obj = BugzillaWorker(self.cfg, None)
-        self.assertTrue(hasattr(obj, 'on_comment'))
+        for task in ('comment', 'status', 'see_also', 'keywords', 'whiteboard'):
+            self.assertTrue(hasattr(obj, 'on_{}'.format(task)))
+
+    def test_render_comment(self):
+        obj = BugzillaWorker(self.cfg, None)
+        expected = obj._setup_default_args()
+        expected.extend(('modify', '1', '--comment=xfoo bary'))
+        self.assertListEqual(expected, obj.render(self.update('comment')))
 
-    @mock.patch('snolla.bugzilla.BugzillaWorker.on_comment')
-    def test_process_ok(self, mock_comment):
-        task = {'task': 'comment'}
+    def test_render_combined(self):
         obj = BugzillaWorker(self.cfg, None)
-        obj.process(task)
-        mock_comment.assert_called_once_with(task)
+        update = Update(bugid=1, tasks=(
+            self.task('comment', 'a'), self.task('comment', 'b'), self.task('status', 'a'),
+            self.task('see_also', 'a'), self.task('see_also', 'b'),
+            self.task('keywords', 'a'), self.task('keywords', 'b'), self.task('whiteboard', 'a')), attempt=0)
+        expected = obj._setup_default_args()
+        expected.extend(('modify', '1', '--comment=xfoo bary\n\nxfoo bary\n\nfixed by a',
+            '--status=RESOLVED', '--field=resolution=FIXED', '--keywords=+Backport', '--keywords=-Triaged',
+            '--whiteboard=+[a]', '--field-json={"see_also": {"add": ["http://localhost/a", "http://localhost/b"]}}'))
+        self.assertListEqual(expected, obj.render(update))
+
+    def test_render_empty_template(self):
+        obj = BugzillaWorker(self.cfg, None)
+        self.cfg['tasks']['see_also']['template'] = ''
+        self.cfg['tasks']['whiteboard']['template'] = ''
+        self.assertIsNone(obj.render(Update(bugid=1, tasks=(self.task('see_also'), self.task('whiteboard')), attempt=0)))
 
-    @mock.patch('snolla.bugzilla.BugzillaWorker.on_comment')
-    def test_process_failed(self, mock_comment):
+    def test_render_unknown_task(self):
         obj = BugzillaWorker(self.cfg, None)
-        obj.process({'task': 'not_found'})
-        self.assertFalse(mock_comment.called)
+        self.assertIsNone(obj.render(self.update('not_found')))
+
+        expected = obj._setup_default_args()
+        expected.extend(('modify', '1', '--comment=xfoo bary'))
+        update = Update(bugid=1, tasks=(self.task('not_found'), self.task('comment')), attempt=0)
+        self.assertListEqual(expected, obj.render(update))
 
     @mock.patch('snolla.bugzilla.BugzillaWorker.external_command')
-    def test_on_comment(self, mock_ext):
+    def test_process(self, mock_ext):
         obj = BugzillaWorker(self.cfg, None)
-        args = obj._setup_default_args()
-        args.extend(('modify', '1', '--comment=xfoo bary'))
+        update = self.update('comment')
 
         # Command succeeds
         mock_ext.return_value = True
-        obj.on_comment({'bugid': 1, 'commit': {'author_name': 'foo bar'}})
-        mock_ext.assert_called_once_with(args)
+        obj.process(update)
+        mock_ext.assert_called_once_with(obj.render(update))
 
         # Command fails
         mock_ext.reset_mock()
         mock_ext.return_value = False
-        obj.on_comment({'bugid': 1, 'commit': {'author_name': 'foo bar'}})
-        mock_ext.assert_called_once_with(args)
+        obj.process(update)
+        mock_ext.assert_called_once_with(obj.render(update))
+
+    @mock.patch('snolla.bugzilla.BugzillaWorker.external_command')
+    def test_process_without_changes(self, mock_ext):
+        obj = BugzillaWorker(self.cfg, None)
+        obj.process(self.update('not_found'))
+        self.assertFalse(mock_ext.called)
+
+    @mock.patch('snolla.bugzilla.BugzillaWorker.external_command')
+    def test_process_traced(self, mock_ext):
+        obj = BugzillaWorker(self.cfg, None)
+        trace = mock.MagicMock()
+        task = self.task('comment').replace(commit=self.commit.replace(trace=trace))
+        obj.process(Update(bugid=1, tasks=(task,), attempt=0))
+        self.assertEqual([mock.call('render'), mock.call('backend')], trace.span.call_args_list)
+
+    @mock.patch('snolla.bugzilla.BugzillaWorker.external_command')
+    def test_run_traces_wait_of_coalesced_updates(self, mock_ext):
+        queue = CoalescingQueue(lambda update: 'interactive', {'interactive': 1})
+        trace = mock.MagicMock()
+        task = self.task('comment').replace(commit=self.commit.replace(origin='bugfix/x', origins=('bugfix/x',), trace=trace))
+        queue.put(Update(bugid=1, tasks=(task,), attempt=0))
+        queue.put(Update(bugid=1, tasks=(task.replace(commit=task['commit'].replace(origin='master', origins=('master',))),), attempt=0))
+
+        obj = BugzillaWorker(self.cfg, queue)
+        obj.daemon = True
+        obj.start()
+        queue.join()
+
+        mock_ext.assert_called_once()
+        self.assertIn('task queue wait', [args[0][0] for args in trace.emit.call_args_list])
+
+    def test_retry(self):
+        mock_queue = mock.MagicMock()
+        obj = BugzillaWorker(self.cfg, mock_queue)
+        update = self.update('comment')
+
+        # Retries are disabled
+        self.assertFalse(obj.retry(update))
+        self.assertFalse(mock_queue.put.called)
+
+        # Retry once
+        self.cfg['bugzilla']['retries'] = 1
+        self.assertTrue(obj.retry(update))
+        mock_queue.put.assert_called_once_with(update.replace(attempt=1))
+        self.assertFalse(obj.retry(update.replace(attempt=1)))
+
+    @mock.patch('snolla.bugzilla.BugzillaWorker.retry')
+    @mock.patch('snolla.bugzilla.BugzillaWorker.external_command')
+    def test_process_failed_is_retried(self, mock_ext, mock_retry):
+        obj = BugzillaWorker(self.cfg, None)
+        update = self.update('comment')
+
+        mock_ext.return_value = True
+        obj.process(update)
+        self.assertFalse(mock_retry.called)
+
+        mock_ext.return_value = False
+        obj.process(update)
+        mock_retry.assert_called_once_with(update)
 
     def test_setup_default_command(self):
         obj = BugzillaWorker(self.cfg, None)
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from werkzeug.test import Client, EnvironBuilder, run_wsgi_app
+from werkzeug.wrappers import Request, Response
+import gzip
+import os
+import tempfile
+import unittest
+
+from snolla.capture import CaptureMiddleware, CaptureWriter, create_frame, read_capture
+from snolla.records import Delivery
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.gz')
+        os.close(fd)
+        os.unlink(self.path)
+
+        self.deliveries = [Delivery(timestamp=1000.0 + i, method='POST', path='/gitlab', query_string='',
+            headers=(('X-Gitlab-Event', 'Push Hook'), ('Content-Type', 'application/json')),
+            body='{{"delivery": {}}}'.format(i).encode('utf-8')) for i in range(3)]
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def write(self, deliveries):
+        writer = CaptureWriter(self.path)
+        for delivery in deliveries:
+            writer.write(delivery)
+        writer.close()
+
+    def test_roundtrip(self):
+        self.write(self.deliveries)
+        self.assertListEqual(self.deliveries, list(read_capture(self.path)))
+
+    def test_append(self):
+        self.write(self.deliveries[:1])
+        self.write(self.deliveries[1:])
+        self.assertListEqual(self.deliveries, list(read_capture(self.path)))
+
+    def write_cut_off(self, delivery):
+        """Write a frame that was cut off by a crash while it was written."""
+        with open(self.path, 'ab') as f:
+            f.write(gzip.compress(create_frame(delivery))[:-12])
+
+    def test_incomplete_last_frame(self):
+        self.write(self.deliveries[:2])
+        self.write_cut_off(self.deliveries[2])
+        self.assertListEqual(self.deliveries[:2], list(read_capture(self.path)))
+
+    def test_restart_after_crash(self):
+        self.write(self.deliveries[:1])
+        self.write_cut_off(self.deliveries[1])
+        self.write_cut_off(self.deliveries[1])
+        self.write(self.deliveries[1:])
+        self.assertListEqual(self.deliveries, list(read_capture(self.path)))
+
+    def test_read_frames_of_single_member(self):
+        with gzip.open(self.path, 'wb') as f:
+            for delivery in self.deliveries:
+                f.write(create_frame(delivery))
+        self.assertListEqual(self.deliveries, list(read_capture(self.path)))
+
+    def test_read_large_capture(self):
+        deliveries = [delivery.replace(body=os.urandom(50000)) for delivery in self.deliveries]
+        self.write(deliveries[:2])
+        self.write_cut_off(deliveries[2])
+        self.write(deliveries[2:])
+        self.assertListEqual(deliveries, list(read_capture(self.path)))
+
+    def create_app(self, received):
+        def app(environ, start_response):
+            received.append(Request(environ).get_data())
+            return Response('ok')(environ, start_response)
+        return app
+
+    def chunked_environ(self, body):
+        """Create the environ of a request with chunked transfer encoding, as
+        passed on by the server."""
+        environ = EnvironBuilder(path='/gitlab', method='POST', data=body,
+                content_type='application/json').get_environ()
+        del environ['CONTENT_LENGTH']
+        environ['wsgi.input_terminated'] = True
+        return environ
+
+    def test_middleware(self):
+        received = []
+        middleware = CaptureMiddleware(self.create_app(received), self.path, 1024)
+        client = Client(middleware)
+        client.post('/gitlab?x=1', data=b'{"a": 1}', content_type='application/json',
+                headers={'X-Gitlab-Event': 'Push Hook', 'X-Gitlab-Token': 'secret'})
+        client.get('/')
+        middleware.writer.close()
+
+        self.assertListEqual([b'{"a": 1}', b''], received)
+        deliveries = list(read_capture(self.path))
+        self.assertEqual(2, len(deliveries))
+        self.assertEqual('POST', deliveries[0]['method'])
+        self.assertEqual('/gitlab', deliveries[0]['path'])
+        self.assertEqual('x=1', deliveries[0]['query_string'])
+        self.assertEqual(b'{"a": 1}', deliveries[0]['body'])
+        self.assertIn(('X-Gitlab-Event', 'Push Hook'), deliveries[0]['headers'])
+        self.assertIn(('Content-Type', 'application/json'), deliveries[0]['headers'])
+        self.assertNotIn('X-Gitlab-Token', dict(deliveries[0]['headers']))
+        self.assertEqual('GET', deliveries[1]['method'])
+        self.assertLessEqual(deliveries[0]['timestamp'], deliveries[1]['timestamp'])
+
+    def test_middleware_chunked(self):
+        received = []
+        middleware = CaptureMiddleware(self.create_app(received), self.path, 1024)
+        run_wsgi_app(middleware, self.chunked_environ(b'{"a": 1}'), buffered=True)
+        middleware.writer.close()
+
+        self.assertListEqual([b'{"a": 1}'], received)
+        self.assertEqual(b'{"a": 1}', next(read_capture(self.path))['body'])
+
+    def test_middleware_large_body(self):
+        body = b'x' * 100
+        received = []
+        middleware = CaptureMiddleware(self.create_app(received), self.path, 10)
+        Client(middleware).post('/gitlab', data=body)
+        run_wsgi_app(middleware, self.chunked_environ(body), buffered=True)
+        middleware.writer.close()
+
+        self.assertListEqual([body, body], received)
+        self.assertListEqual([body[:11], body[:11]], [delivery['body'] for delivery in read_capture(self.path)])
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
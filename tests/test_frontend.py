@@ -1,11 +1,202 @@
 #!/usr/bin/python
 # This file is part of snolla. See README for more information.
 
+import json
+import logging
 import unittest
+import unittest.mock as mock
+from werkzeug.test import Client
 
+from snolla import load_config
 from snolla.frontend import Frontend
+from snolla.snolla import SnollaWorker
+from snolla.tenant import DEFAULT_TENANT, Tenant, TenantRouter
 
 class TestFrontend(unittest.TestCase):
-    pass
+
+    def setUp(self):
+        # Disable logging during unittests
+        logging.disable(logging.CRITICAL)
+
+        # A sample config
+        self.cfg = {
+            'general': {
+                'max_content_length': 4096,
+                },
+            'instrumentation': {
+                'tracing': False,
+                'profiler': False,
+                'queue_stats': False,
+                }
+            }
+
+        with open('tests/test_data/gitlab_push_fixture_2.json', 'rb') as f:
+            self.push_data = f.read()
+        with open('tests/test_data/gitlab_merge_request_fixture_1.json', 'rb') as f:
+            self.merge_request_data = f.read()
+
+        self.queue = mock.MagicMock()
+        self.client = Client(Frontend(self.cfg, self.queue))
+
+    def post(self, url, data, event=None, content_type='application/json'):
+        headers = {'X-Gitlab-Event': event} if event else {}
+        return self.client.post(url, data=data, headers=headers, content_type=content_type)
+
+    def test_index(self):
+        self.assertEqual(200, self.client.get('/').status_code)
+
+    def test_push(self):
+        response = self.post('/gitlab', self.push_data, 'Push Hook')
+        self.assertEqual(200, response.status_code)
+        self.queue.put.assert_called_once()
+        self.assertEqual(2, len(self.queue.put.call_args[0][0]))
+
+    def test_truncated_push(self):
+        gitlab_queue = mock.MagicMock()
+        self.queue.route.return_value.config = {'general': {'allowed_origins': ['master']}}
+        self.client = Client(Frontend(self.cfg, self.queue, gitlab_queue))
+        response = self.post('/gitlab', self.push_data, 'Push Hook')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(self.queue.put.call_args[0][0]))
+        self.assertEqual(4, gitlab_queue.put.call_args[0][0]['push_size'])
+        self.queue.route.assert_called_once_with('diaspora')
+
+    def test_truncated_push_not_served(self):
+        gitlab_queue = mock.MagicMock()
+        self.client = Client(Frontend(self.cfg, self.queue, gitlab_queue))
+        self.queue.route.return_value = None
+        self.assertEqual(200, self.post('/gitlab', self.push_data, 'Push Hook').status_code)
+
+        self.queue.route.return_value = mock.MagicMock(config={'general': {'allowed_origins': ['bugfix/']}})
+        self.assertEqual(200, self.post('/gitlab', self.push_data, 'Push Hook').status_code)
+        self.assertFalse(gitlab_queue.put.called)
+
+    def test_push_without_event_header(self):
+        response = self.post('/gitlab/push', self.push_data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(self.queue.put.call_args[0][0]))
+
+    @mock.patch('snolla.utils.extract_gitlab_commit_data')
+    def test_push_endpoint_routes_on_event_header(self, mock_extract):
+        response = self.post('/gitlab/push', self.merge_request_data, 'Merge Request Hook')
+        self.assertEqual(202, response.status_code)
+        self.assertFalse(mock_extract.called)
+
+    def test_merge_request_is_ignored(self):
+        with mock.patch('werkzeug.wrappers.Request.stream') as mock_stream:
+            response = self.post('/gitlab', self.merge_request_data, 'Merge Request Hook')
+        self.assertEqual(202, response.status_code)
+        self.assertFalse(mock_stream.read.called)
+        self.assertFalse(self.queue.put.called)
+
+    def test_merge_links_once_from_push(self):
+        valid, config = load_config('config/snolla.conf.example', 'config/snolla.conf.spec')
+        self.assertTrue(valid)
+        config['tasks']['status']['enabled'] = True
+        tenant = Tenant(DEFAULT_TENANT, config, ('',))
+        self.client = Client(Frontend(self.cfg, TenantRouter([tenant])))
+
+        # The push to the target branch of the merge, with the commit of the
+        # merge request and the merge commit.
+        merge_request = json.loads(self.merge_request_data.decode('utf-8'))
+        push = json.loads(self.push_data.decode('utf-8'))
+        push.update(ref='refs/heads/master', total_commits_count=2, project=merge_request['project'])
+        push['commits'] = [merge_request['object_attributes']['last_commit'], dict(
+            merge_request['object_attributes']['last_commit'], id='f' * 40,
+            message="Merge branch 'bugfix/spelling' into 'master'\n\nFix spelling, see #2\n\nSee merge request !1")]
+
+        self.assertEqual(202, self.post('/gitlab', self.merge_request_data, 'Merge Request Hook').status_code)
+        self.assertEqual(200, self.post('/gitlab', json.dumps(push).encode('utf-8'), 'Push Hook').status_code)
+
+        worker = SnollaWorker(config, tenant.commit_queue, tenant.bugzilla_task_queue)
+        while not tenant.commit_queue.empty():
+            worker.process(tenant.commit_queue.get_nowait())
+        updates = []
+        while not tenant.bugzilla_task_queue.empty():
+            updates.append(tenant.bugzilla_task_queue.get_nowait())
+
+        self.assertListEqual([1, 2], [update['bugid'] for update in updates])
+        self.assertListEqual([['status'], ['comment']], [[task['task'] for task in update['tasks']] for update in updates])
+
+    @mock.patch('snolla.utils.extract_gitlab_commit_data')
+    def test_unsupported_event_is_ignored(self, mock_extract):
+        for url in ('/gitlab', '/gitlab/push'):
+            response = self.post(url, b'not even json', 'Pipeline Hook')
+            self.assertEqual(202, response.status_code)
+        self.assertFalse(mock_extract.called)
+        self.assertFalse(self.queue.put.called)
+
+    def test_missing_event_is_ignored(self):
+        response = self.post('/gitlab', self.push_data)
+        self.assertEqual(202, response.status_code)
+        self.assertFalse(self.queue.put.called)
+
+    def test_method_not_allowed(self):
+        response = self.client.get('/gitlab/push')
+        self.assertEqual(405, response.status_code)
+
+    def test_no_json(self):
+        response = self.post('/gitlab', self.push_data, 'Push Hook', content_type='text/plain')
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(self.queue.put.called)
+
+    def test_invalid_json(self):
+        response = self.post('/gitlab', b'{', 'Push Hook')
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(self.queue.put.called)
+
+    def test_malformed_payload(self):
+        push = json.loads(self.push_data.decode('utf-8'))
+        del push['repository']
+        push.pop('project', None)
+        for data in (b'\xff{}', b'[]', b'"push"', b'{"commits": 1}', json.dumps(push).encode('utf-8')):
+            response = self.post('/gitlab', data, 'Push Hook')
+            self.assertEqual(400, response.status_code, data)
+        self.assertFalse(self.queue.put.called)
+
+    def test_tracing(self):
+        response = self.post('/gitlab', self.push_data, 'Push Hook')
+        self.assertEqual('NullTrace()', repr(self.queue.put.call_args[0][0][0]['trace']))
+
+        self.cfg['instrumentation']['tracing'] = True
+        self.client = Client(Frontend(self.cfg, self.queue))
+        response = self.client.post('/gitlab', data=self.push_data, content_type='application/json',
+                headers={'X-Gitlab-Event': 'Push Hook', 'X-Gitlab-Event-UUID': 'abc'})
+        self.assertEqual(200, response.status_code)
+        commits = self.queue.put.call_args[0][0]
+        self.assertEqual('abc', commits[0]['trace'].id)
+        self.assertIs(commits[0]['trace'], commits[1]['trace'])
+
+    def test_profile_disabled(self):
+        self.assertEqual(404, self.client.get('/admin/profile').status_code)
+
+    @mock.patch('snolla.instrumentation.SamplingProfiler.profile')
+    def test_profile(self, mock_profile):
+        self.cfg['instrumentation'].update(profiler=True, profiler_interval=10, profiler_max_seconds=5)
+        self.client = Client(Frontend(self.cfg, self.queue))
+
+        mock_profile.return_value = {'main;a': 2}
+        response = self.client.get('/admin/profile?seconds=100')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'main;a 2\n', response.data)
+        mock_profile.assert_called_once_with(5)
+
+        mock_profile.return_value = None
+        self.assertEqual(409, self.client.get('/admin/profile').status_code)
+
+    def test_queue_stats(self):
+        self.assertEqual(404, self.client.get('/admin/queues').status_code)
+
+        self.cfg['instrumentation']['queue_stats'] = True
+        self.client = Client(Frontend(self.cfg, self.queue))
+        self.queue.stats.return_value = {'default': {'commit_queue': {'bulk': {'waiting': 1}}}}
+        response = self.client.get('/admin/queues')
+        self.assertEqual(200, response.status_code)
+        self.assertDictEqual(self.queue.stats.return_value, json.loads(response.data.decode('utf-8')))
+
+    def test_too_large(self):
+        response = self.post('/gitlab', b' ' * 4097, 'Push Hook')
+        self.assertEqual(413, response.status_code)
+        self.assertFalse(self.queue.put.called)
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import parse_qs, urlsplit
+import json
+import logging
+import unittest
+import unittest.mock as mock
+
+from snolla.gitlab import NULL_COMMIT_ID, GitlabClient, GitlabWorker
+from snolla.instrumentation import NULL_TRACE
+from snolla.records import TruncatedPush
+
+class FakeGitlab(ThreadingHTTPServer):
+    """A fake GitLab serving the commits API of a single project."""
+
+    def __init__(self):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), FakeGitlabHandler)
+        # The commits of project 5, newest first.
+        self.commits = [{
+            'id': '{:040x}'.format(i),
+            'message': 'Commit {} (see #{}).'.format(i, i),
+            'authored_date': '2014-03-05T08:40:01+01:00',
+            'author_name': 'Foo Bar',
+            'author_email': 'foo@bar.org',
+            } for i in reversed(range(250))]
+        self.requests = []
+        self.failing_pages = set()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+
+class FakeGitlabHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        args = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append((url.path, args, self.headers['PRIVATE-TOKEN']))
+
+        page = int(args.get('page', 1))
+        if url.path != '/api/v4/projects/5/repository/commits' or page in self.server.failing_pages:
+            self.send_error(404 if page not in self.server.failing_pages else 500)
+            return
+
+        per_page = int(args.get('per_page', 20))
+        body = json.dumps(self.server.commits[(page - 1) * per_page:page * per_page]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGitlab(unittest.TestCase):
+
+    def setUp(self):
+        # Disable logging during unittests
+        logging.disable(logging.CRITICAL)
+
+        self.server = FakeGitlab()
+        self.thread = Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01})
+        self.thread.start()
+
+        # A sample config
+        self.cfg = {
+            'gitlab': {
+                'url': self.server.url + '/',
+                'private_token': 'secret',
+                'per_page': 20,
+                'workers': 4,
+                'cache_size': 16,
+                'timeout': 5,
+                }
+            }
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_get_commits(self):
+        client = GitlabClient(self.cfg)
+        commits = client.get_commits(5, 'a' * 40, 'b' * 40, 50)
+        client.close()
+
+        self.assertListEqual(self.server.commits[:50], commits)
+        self.assertEqual(3, len(self.server.requests))
+        for path, args, token in self.server.requests:
+            self.assertEqual('/api/v4/projects/5/repository/commits', path)
+            self.assertEqual('{}..{}'.format('a' * 40, 'b' * 40), args['ref_name'])
+            self.assertEqual('20', args['per_page'])
+            self.assertEqual('secret', token)
+        self.assertListEqual(['1', '2', '3'], sorted(args['page'] for _, args, _ in self.server.requests))
+
+    def test_get_commits_of_new_branch(self):
+        client = GitlabClient(self.cfg)
+        client.get_commits(5, NULL_COMMIT_ID, 'b' * 40, 5)
+        self.assertEqual('b' * 40, self.server.requests[0][1]['ref_name'])
+
+    def test_get_commits_is_cached(self):
+        client = GitlabClient(self.cfg)
+        first = client.get_commits(5, 'a' * 40, 'b' * 40, 40)
+        second = client.get_commits(5, 'a' * 40, 'b' * 40, 40)
+        self.assertListEqual(first, second)
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_cache_size(self):
+        self.cfg['gitlab']['cache_size'] = 1
+        client = GitlabClient(self.cfg)
+        client.get_commits(5, 'a' * 40, 'b' * 40, 40)
+        self.assertEqual(1, len(client.cache))
+
+    def test_failing_page_is_skipped(self):
+        self.server.failing_pages.add(2)
+        client = GitlabClient(self.cfg)
+        commits = client.get_commits(5, 'a' * 40, 'b' * 40, 60)
+        self.assertListEqual(self.server.commits[:20] + self.server.commits[40:60], commits)
+
+    def test_connection_error(self):
+        self.cfg['gitlab']['url'] = 'http://127.0.0.1:1'
+        client = GitlabClient(self.cfg)
+        self.assertListEqual([], client.get_commits(5, 'a' * 40, 'b' * 40, 60))
+
+    def test_worker_queues_missing_commits(self):
+        push = TruncatedPush(project_id=5, project='playground/qt5demo', project_url='https://git/playground/qt5demo',
+                origin='master', before='a' * 40, after='b' * 40, push_size=30,
+                known_ids=frozenset(commit['id'] for commit in self.server.commits[:20]), trace=NULL_TRACE)
+        mock_queue = mock.MagicMock()
+        obj = GitlabWorker(self.cfg, None, mock_queue)
+        obj.process(push)
+
+        mock_queue.put.assert_called_once()
+        commits = mock_queue.put.call_args[0][0]
+        self.assertListEqual([commit['id'] for commit in reversed(self.server.commits[20:30])],
+                [commit['id'] for commit in commits])
+        self.assertEqual('master', commits[0]['origin'])
+        self.assertEqual(30, commits[0]['push_size'])
+        self.assertEqual('https://git/playground/qt5demo/commit/' + commits[0]['id'], commits[0]['url'])
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from collections import Counter
+from threading import Event, Thread
+import logging
+import unittest
+import unittest.mock as mock
+
+from snolla.instrumentation import NULL_TRACE, SamplingProfiler, Trace, format_collapsed_stacks, get_trace
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        # Disable logging during unittests
+        logging.disable(logging.CRITICAL)
+
+    def test_correlation_id(self):
+        self.assertEqual('abc', Trace('abc').id)
+        self.assertNotEqual(Trace().id, Trace().id)
+
+    @mock.patch('snolla.instrumentation.Trace.emit')
+    def test_span(self, mock_emit):
+        trace = Trace('abc')
+        with trace.span('parse'):
+            pass
+        self.assertEqual('parse', mock_emit.call_args[0][0])
+        self.assertGreaterEqual(mock_emit.call_args[0][1], 0)
+
+    @mock.patch('snolla.instrumentation.Trace.emit')
+    def test_span_on_exception(self, mock_emit):
+        trace = Trace('abc')
+        with self.assertRaises(ValueError):
+            with trace.span('parse'):
+                raise ValueError()
+        self.assertEqual('parse', mock_emit.call_args[0][0])
+
+    def test_null_trace(self):
+        with NULL_TRACE.span('parse'):
+            NULL_TRACE.emit('wait', 0.1)
+
+    def test_get_trace(self):
+        trace = Trace()
+        self.assertIs(trace, get_trace(mock.Mock(trace=trace)))
+        self.assertIs(NULL_TRACE, get_trace({'id': 1}))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def test_profile(self):
+        stop = Event()
+        def wait_for_stop():
+            stop.wait()
+        thread = Thread(target=wait_for_stop, name='waiter')
+        thread.start()
+        try:
+            stacks = SamplingProfiler(0.001).profile(0.05)
+        finally:
+            stop.set()
+            thread.join()
+
+        waiter = [stack for stack in stacks if stack.startswith('waiter;')]
+        self.assertTrue(waiter)
+        self.assertTrue(any('wait_for_stop (test_instrumentation.py:' in stack for stack in waiter))
+
+    def test_profile_is_exclusive(self):
+        profiler = SamplingProfiler(0.001)
+        with profiler.lock:
+            self.assertIsNone(profiler.profile(0.01))
+
+    def test_format_collapsed_stacks(self):
+        stacks = Counter({'main;b': 1, 'main;a;c': 3})
+        self.assertEqual('main;a;c 3\nmain;b 1\n', format_collapsed_stacks(stacks))
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
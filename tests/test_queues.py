@@ -0,0 +1,220 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from queue import Empty
+import threading
+import time
+import unittest
+
+from snolla.queues import CoalescingQueue, LatencyStats, SchedulingQueue
+from snolla.records import Commit, Update
+import snolla.utils as utils
+
+def create_task(commit_id, bugid, origin, task='comment'):
+    commit = Commit(id=commit_id, project='group/project', origin=origin, origins=(origin,), message='msg', timestamp='1',
+            url='http://localhost/gitlab/1', author_name='Foo', author_email='foo@bar.at', push_size=1, trace=None)
+    return utils.create_bugzilla_task(task, bugid, commit)
+
+def create_update(commit_id, bugid, origin, task='comment'):
+    return Update(bugid=bugid, tasks=(create_task(commit_id, bugid, origin, task),), attempt=0)
+
+def get_origins(update):
+    return update['tasks'][0]['commit']['origins']
+
+
+class TestLatencyStats(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertDictEqual({'count': 0, 'p50': None, 'p95': None, 'max': None}, LatencyStats().stats())
+
+    def test_stats(self):
+        latency = LatencyStats(samples=100)
+        for sample in range(200):
+            latency.add(sample)
+        self.assertDictEqual({'count': 200, 'p50': 149, 'p95': 194, 'max': 199}, latency.stats())
+
+
+class TestSchedulingQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = SchedulingQueue(lambda item: item[0], {'interactive': 3, 'bulk': 1})
+
+    def test_fifo_within_class(self):
+        items = [('bulk', i) for i in range(5)]
+        for item in items:
+            self.queue.put(item)
+        self.assertListEqual(items, [self.queue.get_nowait() for _ in items])
+
+    def test_weighted_fair(self):
+        for i in range(8):
+            self.queue.put(('bulk', i))
+        for i in range(6):
+            self.queue.put(('interactive', i))
+
+        classes = [self.queue.get_nowait()[0] for _ in range(14)]
+        self.assertEqual(['interactive', 'interactive', 'bulk', 'interactive'] * 2, classes[:8])
+        self.assertListEqual(['bulk'] * 6, classes[8:])
+        self.assertTrue(self.queue.empty())
+
+    def test_idle_class_does_not_accumulate_credits(self):
+        for i in range(4):
+            self.queue.put(('bulk', i))
+        for _ in range(4):
+            self.queue.get_nowait()
+
+        for i in range(4):
+            self.queue.put(('bulk', i))
+            self.queue.put(('interactive', i))
+        classes = [self.queue.get_nowait()[0] for _ in range(4)]
+        self.assertEqual(3, classes.count('interactive'))
+
+    def test_delayed_item_is_held_back(self):
+        queue = SchedulingQueue(lambda item: item[0], {'interactive': 3, 'bulk': 1}, delay=lambda item: item[2])
+        queue.put(('bulk', 1, 60))
+        queue.put(('interactive', 2, 0))
+        self.assertEqual(2, queue.qsize())
+        self.assertEqual(('interactive', 2, 0), queue.get_nowait())
+        self.assertRaises(Empty, queue.get_nowait)
+        self.assertRaises(Empty, queue.get, timeout=0.01)
+        self.assertEqual(1, queue.qsize())
+
+    def test_blocking_get_waits_for_delay(self):
+        queue = SchedulingQueue(lambda item: item[0], {'interactive': 3, 'bulk': 1}, delay=lambda item: item[2])
+        queue.put(('bulk', 1, 0.05))
+        start = time.monotonic()
+        self.assertEqual(('bulk', 1, 0.05), queue.get(timeout=5))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertLess(queue.wait(), 0.05)
+
+    def test_ready_item_is_not_held_back_by_later_item(self):
+        queue = SchedulingQueue(lambda item: 'retry', {'retry': 1}, delay=lambda item: item[1])
+        queue.put(('attempt 3', 60))
+        queue.put(('attempt 1', 0.01))
+        queue.put(('attempt 2', 0.02))
+        self.assertEqual(('attempt 1', 0.01), queue.get(timeout=5))
+        self.assertEqual(('attempt 2', 0.02), queue.get(timeout=5))
+        self.assertRaises(Empty, queue.get_nowait)
+
+    def test_blocking_get_wakes_up_on_put(self):
+        queue = SchedulingQueue(lambda item: item[0], {'interactive': 3, 'bulk': 1}, delay=lambda item: item[2])
+        queue.put(('bulk', 1, 60))
+        threading.Timer(0.01, queue.put, (('interactive', 2, 0),)).start()
+        self.assertEqual(('interactive', 2, 0), queue.get(timeout=5))
+
+    def test_wait(self):
+        self.assertEqual(0.0, self.queue.wait())
+        self.queue.put(('bulk', 1))
+        self.queue.get_nowait()
+        self.assertGreaterEqual(self.queue.wait(), 0.0)
+        self.assertEqual(self.queue.stats()['bulk']['max'], self.queue.wait())
+
+    def test_stats(self):
+        self.queue.put(('bulk', 1))
+        self.queue.put(('bulk', 2))
+        self.queue.get_nowait()
+
+        stats = self.queue.stats()
+        self.assertEqual(1, stats['bulk']['waiting'])
+        self.assertEqual(1, stats['bulk']['count'])
+        self.assertGreaterEqual(stats['bulk']['max'], 0)
+        self.assertEqual(0, stats['interactive']['waiting'])
+        self.assertEqual(0, stats['interactive']['count'])
+
+
+class TestCoalescingQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = CoalescingQueue(lambda update: 'interactive', {'interactive': 1})
+
+    def test_fifo(self):
+        updates = [create_update('a', 1, 'master'), create_update('b', 1, 'master'), create_update('a', 2, 'master')]
+        for update in updates:
+            self.queue.put(update)
+        self.assertEqual(3, self.queue.qsize())
+        self.assertListEqual(updates, [self.queue.get_nowait() for _ in updates])
+        self.assertTrue(self.queue.empty())
+
+    def test_coalesce_origins(self):
+        self.queue.put(create_update('a', 1, 'bugfix/x'))
+        self.queue.put(create_update('b', 1, 'master'))
+        self.queue.put(create_update('a', 1, 'master'))
+        self.assertEqual(2, self.queue.qsize())
+
+        update = self.queue.get_nowait()
+        self.assertEqual('a', update['tasks'][0]['commit']['id'])
+        self.assertEqual(('bugfix/x', 'master'), get_origins(update))
+        self.assertEqual('bugfix/x', update['tasks'][0]['commit']['origin'])
+        self.assertEqual('b', self.queue.get_nowait()['tasks'][0]['commit']['id'])
+        self.assertTrue(self.queue.empty())
+
+    def test_coalesce_only_waiting_tasks(self):
+        self.queue.put(create_update('a', 1, 'bugfix/x'))
+        self.assertEqual(('bugfix/x',), get_origins(self.queue.get_nowait()))
+        self.queue.put(create_update('a', 1, 'master'))
+        self.assertEqual(('master',), get_origins(self.queue.get_nowait()))
+
+    def test_different_tasks_are_not_coalesced(self):
+        self.queue.put(create_update('a', 1, 'bugfix/x'))
+        self.queue.put(create_update('a', 1, 'master', task='other'))
+        self.assertEqual(2, self.queue.qsize())
+
+    def test_coalesce_updates_with_several_tasks(self):
+        tasks = (create_task('a', 1, 'bugfix/x'), create_task('b', 1, 'bugfix/x', task='status'))
+        self.queue.put(Update(bugid=1, tasks=tasks, attempt=0))
+        self.queue.put(Update(bugid=1, tasks=tuple(task.replace(commit=task['commit'].replace(
+            origin='master', origins=('master',))) for task in tasks), attempt=0))
+        self.queue.put(Update(bugid=1, tasks=tasks[:1], attempt=0))
+        self.assertEqual(1, self.queue.qsize())
+
+        update = self.queue.get_nowait()
+        self.assertListEqual([('bugfix/x', 'master')] * 2, [task['commit']['origins'] for task in update['tasks']])
+
+    def test_coalesce_partial_overlap(self):
+        self.queue = CoalescingQueue(lambda update: 'bulk', {'bulk': 1}, order={'comment': 10, 'status': 20})
+        self.queue.put(Update(bugid=1, tasks=(create_task('a', 1, 'bugfix/x'), create_task('b', 1, 'bugfix/x', task='status')),
+            attempt=0))
+        self.queue.put(Update(bugid=1, tasks=(create_task('b', 1, 'master'), create_task('b', 1, 'master', task='status')),
+            attempt=0))
+        self.assertEqual(1, self.queue.qsize())
+
+        update = self.queue.get_nowait()
+        self.assertListEqual([('a', 'comment'), ('b', 'comment'), ('b', 'status')],
+                [(task['commit']['id'], task['task']) for task in update['tasks']])
+        self.assertListEqual([('bugfix/x',), ('master',), ('bugfix/x', 'master')],
+                [task['commit']['origins'] for task in update['tasks']])
+        self.assertTrue(self.queue.empty())
+
+    def test_coalesce_overlap_with_several_updates(self):
+        self.queue.put(create_update('a', 1, 'bugfix/x'))
+        self.queue.put(create_update('b', 1, 'bugfix/y'))
+        self.queue.put(Update(bugid=1, tasks=tuple(create_task(commit_id, 1, 'master') for commit_id in 'abc'), attempt=0))
+        self.assertEqual(2, self.queue.qsize())
+
+        first, second = self.queue.get_nowait(), self.queue.get_nowait()
+        self.assertListEqual(['a', 'c'], [task['commit']['id'] for task in first['tasks']])
+        self.assertListEqual([('bugfix/x', 'master'), ('master',)], [task['commit']['origins'] for task in first['tasks']])
+        self.assertListEqual([('bugfix/y', 'master')], [task['commit']['origins'] for task in second['tasks']])
+
+    def test_retries_are_not_coalesced(self):
+        self.queue.put(create_update('a', 1, 'master').replace(attempt=1))
+        self.queue.put(create_update('a', 1, 'master'))
+        self.assertEqual(2, self.queue.qsize())
+
+    def test_coalesce_across_classes(self):
+        self.queue = CoalescingQueue(lambda update: update['tasks'][0]['commit']['origin'], {'bugfix/x': 1, 'master': 1})
+        self.queue.put(create_update('a', 1, 'bugfix/x'))
+        self.queue.put(create_update('a', 1, 'master'))
+        self.assertEqual(1, self.queue.qsize())
+        self.assertEqual(1, self.queue.stats()['bugfix/x']['waiting'])
+        self.assertEqual(('bugfix/x', 'master'), get_origins(self.queue.get_nowait()))
+
+    def test_unfinished_tasks(self):
+        self.queue.put(create_update('a', 1, 'bugfix/x'))
+        self.queue.put(create_update('a', 1, 'master'))
+        self.queue.get_nowait()
+        self.queue.task_done()
+        # join() returns immediately if all tasks are done
+        self.queue.join()
+        self.assertRaises(ValueError, self.queue.task_done)
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+import unittest
+
+from snolla.records import Commit, Task, Update
+
+class TestRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = {'id': 'abc', 'project': 'group/project', 'origin': 'master', 'origins': ('master',), 'message': 'a message',
+            'timestamp': '1', 'url': 'http://localhost/gitlab/1',
+            'author_name': 'Foo', 'author_email': 'foo@bar.at', 'push_size': 1, 'trace': None}
+        self.commit = Commit(**self.fields)
+
+    def test_mapping_access(self):
+        self.assertEqual('abc', self.commit['id'])
+        self.assertDictEqual(self.fields, dict(self.commit))
+        self.assertEqual('Foo <foo@bar.at>', '{author_name} <{author_email}>'.format(**self.commit))
+
+    def test_unknown_key(self):
+        self.assertRaises(KeyError, lambda: self.commit['unknown'])
+
+    def test_missing_field(self):
+        del self.fields['id']
+        self.assertRaises(TypeError, Commit, **self.fields)
+
+    def test_unknown_field(self):
+        self.fields['unknown'] = 1
+        self.assertRaises(TypeError, Commit, **self.fields)
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            self.commit.id = 'other'
+        with self.assertRaises(AttributeError):
+            del self.commit.id
+        with self.assertRaises(AttributeError):
+            self.commit.other = 'other'
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.commit, '__dict__'))
+
+    def test_equality(self):
+        self.assertEqual(self.commit, Commit(**self.fields))
+        self.assertEqual(hash(self.commit), hash(Commit(**self.fields)))
+        self.assertNotEqual(self.commit, self.commit.replace(id='def'))
+
+    def test_trace_is_not_compared(self):
+        other = self.commit.replace(trace=object())
+        self.assertEqual(self.commit, other)
+        self.assertEqual(hash(self.commit), hash(other))
+
+    def test_replace(self):
+        other = self.commit.replace(origin='bugfix/x')
+        self.assertEqual('bugfix/x', other['origin'])
+        self.assertEqual('master', self.commit['origin'])
+
+    def test_task(self):
+        task = Task(task='comment', bugid=1, commit=self.commit)
+        self.assertEqual('comment', '{task}'.format(**task))
+        self.assertIs(self.commit, task['commit'])
+
+    def test_update(self):
+        task = Task(task='comment', bugid=1, commit=self.commit)
+        update = Update(bugid=1, tasks=(task,), attempt=0)
+        self.assertIs(task, update['tasks'][0])
+        self.assertEqual(1, update.replace(attempt=1)['attempt'])
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
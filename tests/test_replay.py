@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+from werkzeug.wrappers import Request, Response
+import logging
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+from snolla import load_config
+from snolla.capture import CaptureWriter
+from snolla.records import Delivery
+from snolla.replay import FakeBugzilla, format_report, replay, run
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        # Disable logging during unittests
+        logging.disable(logging.CRITICAL)
+
+        with open('tests/test_data/gitlab_push_fixture_2.json', 'rb') as f:
+            push_data = f.read()
+        self.deliveries = [Delivery(timestamp=1000.0 + i * 0.05, method='POST', path='/gitlab', query_string='',
+            headers=(('X-Gitlab-Event', event), ('Content-Type', 'application/json')),
+            body=push_data) for i, event in enumerate(('Push Hook', 'Pipeline Hook', 'Push Hook'))]
+
+    def test_replay(self):
+        requests = []
+        def app(environ, start_response):
+            request = Request(environ)
+            requests.append((request.headers['X-Gitlab-Event'], request.get_data()))
+            return Response('ok')(environ, start_response)
+
+        latencies, statuses = replay(app, self.deliveries)
+        self.assertEqual(3, latencies.count)
+        self.assertDictEqual({200: 3}, statuses)
+        self.assertListEqual([(delivery['headers'][0][1], delivery['body']) for delivery in self.deliveries], requests)
+
+    @mock.patch('time.sleep')
+    def test_replay_speed(self, mock_sleep):
+        app = lambda environ, start_response: Response('ok')(environ, start_response)
+        replay(app, self.deliveries, speed=0.5)
+        delays = [args[0][0] for args in mock_sleep.call_args_list]
+        self.assertEqual(2, len(delays))
+        self.assertAlmostEqual(0.2, delays[-1], delta=0.05)
+
+    def test_fake_bugzilla(self):
+        backend = FakeBugzilla(0)
+        self.assertTrue(backend.call(['modify']))
+        self.assertEqual(1, backend.calls)
+
+    def test_run(self):
+        fd, path = tempfile.mkstemp(suffix='.gz')
+        os.close(fd)
+        try:
+            writer = CaptureWriter(path)
+            for delivery in self.deliveries:
+                writer.write(delivery)
+            writer.close()
+
+            valid, config = load_config('config/snolla.conf.example', 'config/snolla.conf.spec')
+            self.assertTrue(valid)
+            config['bugzilla']['workers'] = 1
+            # The second push arrives while the single worker updates the
+            # first bug of the first push, see below.
+            report = run(config, path, speed=1, latency=0.3)
+        finally:
+            os.unlink(path)
+
+        self.assertEqual(3, report['deliveries'])
+        self.assertDictEqual({200: 2, 202: 1}, report['statuses'])
+        # Both pushes mention bugs 4 and 43. The update of bug 4 of the first
+        # push is in flight when the second push arrives, the update of bug 43
+        # is still waiting and coalesces with the one of the second push.
+        self.assertEqual(3, report['bugzilla_calls'])
+        self.assertEqual(2, report['queues']['default']['commit_queue']['interactive']['count'])
+        self.assertIn('Replayed 3 deliveries', format_report(report))
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
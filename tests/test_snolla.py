@@ -1,10 +1,14 @@
 #!/usr/bin/python
 # This file is part of snolla. See README for more information.
 
+from configobj import ConfigObj
+from validate import Validator
 import logging
 import unittest
 import unittest.mock as mock
 
+from snolla.instrumentation import NULL_TRACE
+from snolla.records import Commit
 from snolla.snolla import SnollaWorker
 
 class TestSnollaWorker(unittest.TestCase):
@@ -32,13 +36,11 @@ class TestSnollaWorker(unittest.TestCase):
         mock_task.return_value = None
         mock_config.return_value = 'foo'
 
-        mock_queue = mock.MagicMock()
-        obj = SnollaWorker(self.cfg, None, mock_queue)
-        obj.handle_extracted_action('action', 1, 'the commit')
+        obj = SnollaWorker(self.cfg, None, None)
+        self.assertIsNone(obj.handle_extracted_action('action', 1, 'the commit'))
 
         mock_task.assert_called_once_with('action', mock_config.return_value)
         mock_config.assert_called_once_with(self.cfg)
-        self.assertFalse(mock_queue.called)
         self.assertFalse(mock_create.called)
 
     @mock.patch('snolla.utils.create_bugzilla_task')
@@ -49,14 +51,12 @@ class TestSnollaWorker(unittest.TestCase):
         mock_config.return_value = 'foo'
         mock_create.return_value = 'the bugzilla task'
 
-        mock_queue = mock.MagicMock()
-        obj = SnollaWorker(self.cfg, None, mock_queue)
-        obj.handle_extracted_action('action', 1, 'the commit')
+        obj = SnollaWorker(self.cfg, None, None)
+        self.assertEqual('the bugzilla task', obj.handle_extracted_action('action', 1, 'the commit'))
 
         mock_task.assert_called_once_with('action', mock_config.return_value)
         mock_config.assert_called_once_with(self.cfg)
         mock_create.assert_called_once_with('afinetask', 1, 'the commit')
-        mock_queue.put.assert_called_once_with('the bugzilla task')
 
     @mock.patch('snolla.utils.is_origin_allowed')
     def test_handle_extracted_action(self, mock_origin):
@@ -79,7 +79,7 @@ class TestSnollaWorker(unittest.TestCase):
         mock_origin.return_value = False
 
         obj = SnollaWorker(self.cfg, None, None)
-        obj.process(self.commit)
+        self.assertListEqual([], obj.process_commit(self.commit))
 
         mock_origin.assert_called_once_with(self.commit)
         self.assertFalse(mock_extract.called)
@@ -92,7 +92,7 @@ class TestSnollaWorker(unittest.TestCase):
         mock_extract.return_value = []
 
         obj = SnollaWorker(self.cfg, None, None)
-        obj.process(self.commit)
+        self.assertListEqual([], obj.process_commit(self.commit))
 
         mock_origin.assert_called_once_with(self.commit)
         mock_extract.assert_called_once_with(self.commit['message'], self.cfg['general']['extract_regex'])
@@ -103,10 +103,11 @@ class TestSnollaWorker(unittest.TestCase):
     @mock.patch('snolla.snolla.SnollaWorker.check_allowed_origins')
     def test_process_has_action_and_bugid(self, mock_origin, mock_extract, mock_handle):
         mock_origin.return_value = True
-        mock_extract.return_value = [('action1', 1), ('action2', 2)]
+        mock_extract.return_value = [('action1', 1), ('action2', 2), ('unknown', 3)]
+        mock_handle.side_effect = ['task1', 'task2', None]
 
         obj = SnollaWorker(self.cfg, None, None)
-        obj.process(self.commit)
+        self.assertListEqual(['task1', 'task2'], obj.process_commit(self.commit))
 
         mock_origin.assert_called_once_with(self.commit)
         mock_extract.assert_called_once_with(self.commit['message'], self.cfg['general']['extract_regex'])
@@ -114,4 +115,31 @@ class TestSnollaWorker(unittest.TestCase):
         expected = [mock.call(action, bugid, self.commit) for action, bugid in mock_extract.return_value]
         self.assertEqual(expected, mock_handle.call_args_list)
 
+    def test_process_merges_tasks_per_bug(self):
+        cfg = ConfigObj([
+            "[general]",
+            "allowed_origins = 'master',",
+            "extract_regex = '(?P<action>\\w+)?:?\\s*#(?P<bugid>\\d+)'",
+            "[tasks]",
+            "[[comment]]",
+            "keywords = 'see',",
+            "[[status]]",
+            "enabled = True",
+            "keywords = 'fixes',",
+            ], configspec='config/snolla.conf.spec')
+        cfg.validate(Validator())
+        commits = tuple(Commit(id=commit_id, project='group/project', origin='master', origins=('master',), message=message,
+            timestamp='1', url='http://localhost/gitlab/1', author_name='Foo', author_email='foo@bar.at',
+            push_size=2, trace=NULL_TRACE) for commit_id, message in (('a', 'Fixes #1, see #2'), ('b', 'See #1')))
+
+        mock_queue = mock.MagicMock()
+        obj = SnollaWorker(cfg, None, mock_queue)
+        obj.process(commits)
+
+        updates = [args[0][0] for args in mock_queue.put.call_args_list]
+        self.assertListEqual([1, 2], [update['bugid'] for update in updates])
+        self.assertListEqual([('comment', 'b'), ('status', 'a')],
+                [(task['task'], task['commit']['id']) for task in updates[0]['tasks']])
+        self.assertListEqual([('comment', 'a')], [(task['task'], task['commit']['id']) for task in updates[1]['tasks']])
+
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
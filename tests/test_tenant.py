@@ -0,0 +1,183 @@
+#!/usr/bin/python
+# This file is part of snolla. See README for more information.
+
+import logging
+import unittest
+import unittest.mock as mock
+from configobj import ConfigObj
+from validate import Validator
+
+from snolla.tenant import ROUTE_CACHE_SIZE, Tenant, TenantRouter, create_tenants, get_tenant_config
+
+# A sample scheduling config
+SCHEDULING = {
+    'interactive_origins': ['master'],
+    'bulk_push_size': 20,
+    'interactive_weight': 8,
+    'bulk_weight': 1,
+    'retry_weight': 1,
+    }
+
+# A sample bugzilla config
+BUGZILLA = {
+    'workers': 1,
+    'retry_delay': 10,
+    }
+
+def create_config(**bugzilla):
+    return ConfigObj({'bugzilla': dict(BUGZILLA, **bugzilla), 'scheduling': SCHEDULING, 'tasks': {}})
+
+class TestTenantConfig(unittest.TestCase):
+
+    def setUp(self):
+        # Disable logging during unittests
+        logging.disable(logging.CRITICAL)
+
+        self.raw_config = [
+            "[general]",
+            "allowed_origins = 'master',",
+            "[tasks]",
+            "[[comment]]",
+            "keywords = 'see',",
+            "template = 'global'",
+            "[bugzilla]",
+            "url = 'http://global'",
+            "username = 'user'",
+            "password = 'password'",
+            "[tenants]",
+            "[[a]]",
+            "projects = 'group/',",
+            "allowed_origins = 'master', 'bugfix/'",
+            "[[[bugzilla]]]",
+            "url = 'http://a'",
+            "workers = 3",
+            "[[b]]",
+            "projects = 'group/b', 'other/b'",
+            "[[[tasks]]]",
+            "[[[[comment]]]]",
+            "keywords = 'refs',",
+            "template = 'b'",
+            "[[[[status]]]]",
+            "keywords = 'fixes',",
+            "order = 5",
+            "[[[[see_also]]]]",
+            "keywords = 'seealso',",
+            "[[[[whiteboard]]]]",
+            "[[[[custom]]]]",
+            ]
+
+    def load(self, raw_config):
+        config = ConfigObj(raw_config, configspec='config/snolla.conf.spec')
+        self.assertTrue(config.validate(Validator()))
+        return config
+
+    def test_overrides(self):
+        config = get_tenant_config(self.load(self.raw_config), 'a')
+        self.assertListEqual(['master', 'bugfix/'], config['general']['allowed_origins'])
+        self.assertEqual('http://a', config['bugzilla']['url'])
+        self.assertEqual(3, config['bugzilla']['workers'])
+        self.assertEqual('user', config['bugzilla']['username'])
+        self.assertEqual('global', config['tasks']['comment']['template'])
+        self.assertEqual(20, config['scheduling']['bulk_push_size'])
+
+    def test_defaults(self):
+        config = get_tenant_config(self.load(self.raw_config), 'b')
+        self.assertListEqual(['master'], config['general']['allowed_origins'])
+        self.assertEqual('http://global', config['bugzilla']['url'])
+        self.assertEqual(1, config['bugzilla']['workers'])
+        self.assertEqual('b', config['tasks']['comment']['template'])
+        self.assertListEqual(['refs'], config['tasks']['comment']['keywords'])
+
+    def test_task_order(self):
+        config = get_tenant_config(self.load(self.raw_config), 'b')
+        self.assertEqual(10, config['tasks']['comment']['order'])
+        self.assertEqual(5, config['tasks']['status']['order'])
+        self.assertEqual('RESOLVED', config['tasks']['status']['status'])
+
+    def test_task_settings_of_global_task(self):
+        config = get_tenant_config(self.load(self.raw_config), 'b')
+        self.assertEqual('{url}', config['tasks']['see_also']['template'])
+        self.assertListEqual(['seealso'], config['tasks']['see_also']['keywords'])
+        self.assertListEqual(['whiteboard'], config['tasks']['whiteboard']['keywords'])
+        self.assertEqual('', config['tasks']['whiteboard']['template'])
+        self.assertTrue(config['tasks']['whiteboard']['enabled'])
+        self.assertEqual('FIXED', config['tasks']['status']['resolution'])
+        self.assertListEqual([], config['tasks']['custom']['keywords'])
+        self.assertEqual(0, config['tasks']['custom']['order'])
+
+    def test_create_tenants(self):
+        tenants = create_tenants(self.load(self.raw_config))
+        self.assertListEqual(['a', 'b'], [tenant.name for tenant in tenants])
+        self.assertIsNot(tenants[0].commit_queue, tenants[1].commit_queue)
+        self.assertIsNot(tenants[0].bugzilla_task_queue, tenants[1].bugzilla_task_queue)
+
+    def test_create_default_tenant(self):
+        config = self.load(self.raw_config[:self.raw_config.index('[tenants]')])
+        tenants = create_tenants(config)
+        self.assertEqual(1, len(tenants))
+        self.assertIs(config, tenants[0].config)
+        self.assertTrue(tenants[0].serves('any/project'))
+
+
+class TestTenantRouter(unittest.TestCase):
+
+    def setUp(self):
+        # Disable logging during unittests
+        logging.disable(logging.CRITICAL)
+
+        self.tenant_a = Tenant('a', create_config(), ('group/',))
+        self.tenant_b = Tenant('b', create_config(), ('group/b', 'other/b'))
+        self.router = TenantRouter([self.tenant_a, self.tenant_b])
+
+    def test_route(self):
+        self.assertIs(self.tenant_a, self.router.route('group/b'))
+        self.assertIs(self.tenant_a, self.router.route('group/sub/c'))
+        self.assertIs(self.tenant_b, self.router.route('other/b'))
+        self.assertIsNone(self.router.route('other/c'))
+
+    def test_route_is_cached(self):
+        with mock.patch.object(self.tenant_a, 'serves') as mock_serves:
+            mock_serves.return_value = True
+            self.router.route('group/a')
+            self.router.route('group/a')
+            mock_serves.assert_called_once_with('group/a')
+
+    def test_route_cache_is_bounded(self):
+        for number in range(ROUTE_CACHE_SIZE + 10):
+            self.router.route('unknown/{}'.format(number))
+        self.assertEqual(ROUTE_CACHE_SIZE, self.router.route.cache_info().currsize)
+
+    def test_put(self):
+        self.router.put(({'id': 1, 'project': 'other/b', 'origin': 'master', 'push_size': 1},))
+        self.assertEqual(0, self.tenant_a.commit_queue.qsize())
+        self.assertEqual(1, self.tenant_b.commit_queue.qsize())
+
+    def test_stats(self):
+        stats = self.router.stats()
+        self.assertListEqual(['a', 'b'], sorted(stats))
+        self.assertEqual(0, stats['a']['commit_queue']['interactive']['waiting'])
+        self.assertEqual(0, stats['b']['bugzilla_task_queue']['retry']['waiting'])
+
+    def test_put_without_tenant(self):
+        self.router.put(({'id': 1, 'project': 'other/c', 'origin': 'master', 'push_size': 1},))
+        self.assertEqual(0, self.tenant_a.commit_queue.qsize())
+        self.assertEqual(0, self.tenant_b.commit_queue.qsize())
+
+
+class TestTenant(unittest.TestCase):
+
+    @mock.patch('snolla.tenant.BugzillaWorker')
+    @mock.patch('snolla.tenant.SnollaWorker')
+    def test_start(self, mock_snolla, mock_bugzilla):
+        mock_bugzilla.side_effect = lambda *args: mock.MagicMock()
+        config = create_config(workers=3)
+        tenant = Tenant('a', config, ('group/',))
+        tenant.start()
+
+        mock_snolla.assert_called_once_with(config, tenant.commit_queue, tenant.bugzilla_task_queue)
+        self.assertEqual([mock.call(config, tenant.bugzilla_task_queue)] * 3, mock_bugzilla.call_args_list)
+        self.assertEqual(4, len(tenant.workers))
+        for worker in tenant.workers:
+            worker.start.assert_called_once_with()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent
@@ -6,6 +6,7 @@ import json
 import re
 from configobj import ConfigObj
 
+from snolla.records import Commit, Update
 import snolla.utils as utils
 
 class TestGitlabExtractData(unittest.TestCase):
@@ -31,6 +32,10 @@ class TestGitlabExtractData(unittest.TestCase):
         commit = result[0]
         self.assertEqual(commit['id'],
                 'b6568db1bc1dcd7f8b4d5a946b0b91f9dacd7327')
+        self.assertEqual(commit['project'],
+                'diaspora')
+        self.assertEqual(commit['push_size'],
+                4)
         self.assertEqual(commit['origin'],
                 'master')
         self.assertEqual(commit['message'],
@@ -52,6 +57,15 @@ class TestGitlabExtractData(unittest.TestCase):
         self.assertEqual(len(result), 2)
         self.assertNotEqual(result[0], result[1])
 
+    def test_origin_and_author_are_interned(self):
+        data = json.loads(self.json_data)
+        data['commits'][1]['author'] = dict(data['commits'][0]['author'])
+
+        result = utils.extract_gitlab_commit_data(data)
+        self.assertIs(result[0]['origin'], result[1]['origin'])
+        self.assertIs(result[0]['author_name'], result[1]['author_name'])
+        self.assertIs(result[0]['author_email'], result[1]['author_email'])
+
     def test_raises_on_missing_item(self):
         data = json.loads(self.json_data)
         del data['commits'][0]['id']
@@ -59,6 +73,68 @@ class TestGitlabExtractData(unittest.TestCase):
         self.assertRaises(KeyError, utils.extract_gitlab_commit_data, data)
 
 
+class TestGitlabExtractProjectPath(unittest.TestCase):
+
+    def test_project_path_with_namespace(self):
+        data = {'project': {'path_with_namespace': 'group/project'},
+                'repository': {'homepage': 'https://git/other/project'}}
+        self.assertEqual('group/project', utils.extract_gitlab_project_path(data))
+
+    def test_project_path_from_homepage(self):
+        with open('tests/test_data/gitlab_push_fixture_3.json', 'rt') as f:
+            data = json.load(f)
+        self.assertEqual('playground/qt5demo', utils.extract_gitlab_project_path(data))
+
+    def test_raises_on_missing_item(self):
+        self.assertRaises(KeyError, utils.extract_gitlab_project_path, {})
+
+
+class TestGitlabExtractTruncatedPush(unittest.TestCase):
+    def setUp(self):
+        with open('tests/test_data/gitlab_push_fixture_1.json', 'rt') as f:
+            self.json_data = f.read()
+
+    def test_truncated(self):
+        data = json.loads(self.json_data)
+
+        push = utils.extract_gitlab_truncated_push(data, 'the trace')
+        self.assertEqual(15, push['project_id'])
+        self.assertEqual('diaspora', push['project'])
+        self.assertEqual('http://localhost/diaspora', push['project_url'])
+        self.assertEqual('master', push['origin'])
+        self.assertEqual('95790bf891e76fee5e1747ab589903a6a1f80f22', push['before'])
+        self.assertEqual('da1560886d4f094c3e6c9ef40349f7d38b5d27d7', push['after'])
+        self.assertEqual(4, push['push_size'])
+        self.assertSetEqual({commit['id'] for commit in data['commits']}, push['known_ids'])
+        self.assertEqual('the trace', push['trace'])
+
+    def test_not_truncated(self):
+        data = json.loads(self.json_data)
+        data['total_commits_count'] = 2
+        self.assertIsNone(utils.extract_gitlab_truncated_push(data))
+        del data['total_commits_count']
+        self.assertIsNone(utils.extract_gitlab_truncated_push(data))
+
+    def test_api_commits(self):
+        push = utils.extract_gitlab_truncated_push(json.loads(self.json_data))
+        api_commits = [
+            {'id': 'da1560886d4f094c3e6c9ef40349f7d38b5d27d7'},
+            {'id': 'c', 'message': 'c', 'authored_date': '2', 'author_name': 'Foo', 'author_email': 'foo@bar.at',
+                'web_url': 'http://localhost/diaspora/-/commit/c'},
+            {'id': 'b6568db1bc1dcd7f8b4d5a946b0b91f9dacd7327'},
+            {'id': 'a', 'message': 'a', 'authored_date': '1', 'author_name': 'Foo', 'author_email': 'foo@bar.at'},
+            ]
+
+        result = utils.extract_gitlab_api_commit_data(push, api_commits)
+        self.assertListEqual(['a', 'c'], [commit['id'] for commit in result])
+        self.assertEqual('http://localhost/diaspora/commit/a', result[0]['url'])
+        self.assertEqual('http://localhost/diaspora/-/commit/c', result[1]['url'])
+        self.assertEqual('1', result[0]['timestamp'])
+        self.assertEqual('master', result[0]['origin'])
+        self.assertEqual(('master',), result[0]['origins'])
+        self.assertEqual(4, result[0]['push_size'])
+
+
 class TestSnollaExtractActions(unittest.TestCase):
     def setUp(self):
         self.regex = r'(?P<action>\w+)?:?\s*#(?P<bugid>\d+)'
@@ -207,6 +283,62 @@ class TestgetTaskDictFromConfig(unittest.TestCase):
         self.assertDictEqual({'comment': ['see']},
                 utils.get_task_dict_from_config(config))
 
+    def test_task_order(self):
+        raw_config = [
+                "[tasks]",
+                "[[comment]]",
+                "enabled = True",
+                "order = 10",
+                "[[status]]",
+                "enabled = True",
+                "order = 5",
+                "[[bar]]",
+                "enabled = no",
+                "order = 1"]
+        config = ConfigObj(raw_config)
+        self.assertDictEqual({'comment': 10, 'status': 5},
+                utils.get_task_order_from_config(config))
+
+class TestSchedulingClasses(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduling = {
+            'interactive_origins': ['master', 'hotfix/'],
+            'bulk_push_size': 20,
+            'interactive_weight': 8,
+            'bulk_weight': 1,
+            'retry_weight': 2,
+            }
+
+    def test_interactive_commit(self):
+        for origin in ('master', 'hotfix/1'):
+            commit = {'origin': origin, 'push_size': 20}
+            self.assertEqual('interactive', utils.get_commit_class(commit, self.scheduling))
+
+    def test_bulk_commit(self):
+        commit = {'origin': 'master', 'push_size': 21}
+        self.assertEqual('bulk', utils.get_commit_class(commit, self.scheduling))
+        commit = {'origin': 'feature/x', 'push_size': 1}
+        self.assertEqual('bulk', utils.get_commit_class(commit, self.scheduling))
+
+    def test_push_class(self):
+        commits = ({'origin': 'master', 'push_size': 30}, {'origin': 'master', 'push_size': 30})
+        self.assertEqual('bulk', utils.get_push_class(commits, self.scheduling))
+
+    def test_update_class(self):
+        tasks = ({'commit': {'origin': 'master', 'push_size': 1}},)
+        self.assertEqual('interactive', utils.get_update_class({'attempt': 0, 'tasks': tasks}, self.scheduling))
+        self.assertEqual('retry', utils.get_update_class({'attempt': 1, 'tasks': tasks}, self.scheduling))
+
+    def test_update_delay(self):
+        self.assertEqual(0, utils.get_update_delay({'attempt': 0}, 10))
+        self.assertListEqual([10, 20, 40], [utils.get_update_delay({'attempt': attempt}, 10) for attempt in (1, 2, 3)])
+
+    def test_weights(self):
+        self.assertDictEqual({'interactive': 8, 'bulk': 1, 'retry': 2},
+                utils.get_scheduling_weights(self.scheduling))
+
+
 class TestCreateBugzillaTask(unittest.TestCase):
 
     def setUp(self):
@@ -223,8 +355,76 @@ Log: {message}
             'task': 'a task',
             'bugid': 1,
             'commit': self.commit}
+        self.record_fields = dict(self.commit, id='abc', project='group/project', push_size=1, trace=None)
 
     def test_full_bugzilla_task(self):
-        self.assertDictEqual(self.result, utils.create_bugzilla_task('a task', 1, self.commit))
+        self.assertDictEqual(self.result, dict(utils.create_bugzilla_task('a task', 1, self.commit)))
+
+    def record(self, origin, **fields):
+        return Commit(**dict(self.record_fields, origin=origin, origins=(origin,), **fields))
+
+    def test_merge_bugzilla_tasks(self):
+        task = utils.create_bugzilla_task('a task', 1, self.record('bugfix/x'))
+        other = utils.create_bugzilla_task('a task', 1, self.record('master'))
+
+        merged = utils.merge_bugzilla_tasks(task, other)
+        self.assertEqual('bugfix/x', merged['commit']['origin'])
+        self.assertEqual(('bugfix/x', 'master'), merged['commit']['origins'])
+        self.assertEqual(task['commit'].replace(origins=('bugfix/x', 'master')), merged['commit'])
+
+        merged = utils.merge_bugzilla_tasks(merged, task)
+        self.assertEqual(('bugfix/x', 'master'), merged['commit']['origins'])
+
+    def test_merge_bugzilla_tasks_same_origin(self):
+        task = utils.create_bugzilla_task('a task', 1, self.record('master'))
+        other = utils.create_bugzilla_task('a task', 1, self.record('master'))
+        self.assertIs(task, utils.merge_bugzilla_tasks(task, other))
+
+    def test_merged_commit_keeps_its_class(self):
+        scheduling = {'interactive_origins': ['master'], 'bulk_push_size': 20}
+        task = utils.create_bugzilla_task('a task', 1, self.record('master'))
+        merged = utils.merge_bugzilla_tasks(task, utils.create_bugzilla_task('a task', 1, self.record('bugfix/x')))
+        self.assertEqual('interactive', utils.get_commit_class(merged['commit'], scheduling))
+
+    def test_format_commit(self):
+        task = utils.create_bugzilla_task('a task', 1, self.record('bugfix/x'))
+        merged = utils.merge_bugzilla_tasks(task, utils.create_bugzilla_task('a task', 1, self.record('master')))
+        self.assertEqual('abc on bugfix/x', utils.format_commit('{id} on {origin}', task['commit']))
+        self.assertEqual('abc on bugfix/x, master', utils.format_commit('{id} on {origin}', merged['commit']))
+
+    def test_create_bugzilla_updates(self):
+        commit_a = self.record('master', id='a')
+        commit_b = self.record('master', id='b')
+        tasks = [utils.create_bugzilla_task(task, bugid, commit) for task, bugid, commit in (
+            ('status', 1, commit_a), ('comment', 1, commit_a), ('comment', 2, commit_a),
+            ('comment', 1, commit_b), ('comment', 1, commit_a))]
+
+        updates = utils.create_bugzilla_updates(tasks, {'comment': 10, 'status': 20})
+        self.assertListEqual([1, 2], [update['bugid'] for update in updates])
+        self.assertListEqual([tasks[1], tasks[3], tasks[0]], list(updates[0]['tasks']))
+        self.assertListEqual([tasks[2]], list(updates[1]['tasks']))
+        self.assertEqual(0, updates[0]['attempt'])
+
+    def test_merge_bugzilla_updates(self):
+        tasks = [utils.create_bugzilla_task(task, 1, self.record('bugfix/x')) for task in ('comment', 'status')]
+        update = Update(bugid=1, tasks=tuple(tasks), attempt=0)
+        other = Update(bugid=1, tasks=tuple(task.replace(commit=self.record('master')) for task in tasks), attempt=0)
+
+        merged = utils.merge_bugzilla_updates(update, other)
+        self.assertListEqual([('bugfix/x', 'master')] * 2, [task['commit']['origins'] for task in merged['tasks']])
+        self.assertIs(merged, utils.merge_bugzilla_updates(merged, update))
+
+    def test_merge_bugzilla_updates_adds_tasks(self):
+        comment, status = [utils.create_bugzilla_task(task, 1, self.record('master')) for task in ('comment', 'status')]
+        update = Update(bugid=1, tasks=(status,), attempt=0)
+        other = Update(bugid=1, tasks=(comment, status), attempt=0)
+
+        merged = utils.merge_bugzilla_updates(update, other, {'comment': 10, 'status': 20})
+        self.assertListEqual([comment, status], list(merged['tasks']))
+
+    def test_commit_is_shared(self):
+        task_1 = utils.create_bugzilla_task('a task', 1, self.commit)
+        task_2 = utils.create_bugzilla_task('a task', 2, self.commit)
+        self.assertIs(task_1['commit'], task_2['commit'])
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 smartindent autoindent